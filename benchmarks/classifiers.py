@@ -0,0 +1,65 @@
+"""
+Compares the nearest neighbour classifiers (opencv's KNearest and the numpy
+backends) on synthetic training sets of increasing size, made from the features
+of the bundled data plus noise. Low dimensional features (a small feature_size)
+are where the k-d tree pays off.
+Run with: python -m benchmarks.classifiers [--sizes 10000 100000 1000000]
+"""
+from __future__ import print_function
+import argparse
+import timeit
+import numpy
+from simpleocr.files import open_image
+from simpleocr.feature_extraction import SimpleFeatureExtractor
+from simpleocr.ocr import CLASSIFIERS
+
+SIZES = [10000, 100000, 1000000]
+FEATURE_SIZES = [10, 3]
+
+
+def synthetic_samples(feature_size, n, rng):
+    """returns n (features, classes) made by adding noise to the bundled ground features"""
+    extractor = SimpleFeatureExtractor(feature_size=feature_size)
+    features, classes = [], []
+    for name in ("digits1", "digits2"):
+        image = open_image(name)
+        features.append(extractor.extract(image.image, image.ground.segments))
+        classes.append(image.ground.classes)
+    features, classes = numpy.concatenate(features), numpy.concatenate(classes)
+    picked = rng.randint(0, len(features), n)
+    noise = rng.normal(0, 8, size=(n, features.shape[1])).astype(features.dtype)
+    return features[picked] + noise, classes[picked]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--sizes", type=int, nargs="*", default=SIZES, help="training set sizes")
+    parser.add_argument("--queries", type=int, default=1000, help="feature vectors classified per run")
+    parser.add_argument("--k", type=int, default=1)
+    parser.add_argument("--classifiers", nargs="*", default=["knn", "bruteforce", "kdtree"], help="keys of CLASSIFIERS")
+    args = parser.parse_args(argv)
+    rng = numpy.random.RandomState(0)
+    for feature_size in FEATURE_SIZES:
+        queries, _ = synthetic_samples(feature_size, args.queries, rng)
+        for size in args.sizes:
+            features, classes = synthetic_samples(feature_size, size, rng)
+            reference = None
+            for name in args.classifiers:
+                classifier = CLASSIFIERS[name](k=args.k)
+                start = timeit.default_timer()
+                classifier.train(features, classes)
+                classifier.classify(queries[:1])  # models are built lazily
+                train_seconds = timeit.default_timer() - start
+                start = timeit.default_timer()
+                result = classifier.classify(queries)
+                classify_seconds = timeit.default_timer() - start
+                if reference is None:
+                    reference = result
+                print("{0:>4} dims {1:>8} samples {2:>11}: train {3:9.1f} ms, classify {4:9.1f} ms "
+                      "({5:9.0f} queries/s), {6:6.1%} same as {7}".format(
+                          feature_size ** 2, size, name, train_seconds * 1000, classify_seconds * 1000,
+                          len(queries) / classify_seconds, numpy.mean(result == reference), args.classifiers[0]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+"""
+Compares the PIL (ImageEnhance) image enhancement path with EnhanceProcessor,
+in time and in the largest difference between their results, on a large page.
+Run with: python -m benchmarks.enhance
+"""
+from __future__ import print_function
+import argparse
+import timeit
+import numpy
+from simpleocr.opencv_utils import EnhanceProcessor
+from benchmarks.pipeline import scaled_page
+from tests.pil_reference import pil_enhance
+
+SETTINGS = [
+    {"brightness": 1.2},
+    {"contrast": 1.5},
+    {"brightness": 1.2, "contrast": 1.5, "invert": True},
+    {"color": 0.5, "brightness": 1.2, "contrast": 1.5},
+    {"sharpness": 2.0},
+    {"color": 0.5, "brightness": 1.2, "contrast": 1.5, "sharpness": 2.0, "invert": True},
+]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--scale", type=int, default=64, help="copies of the page")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+    page = scaled_page("digits1", args.scale)
+    print("page: {0}x{1}".format(page.image.shape[1], page.image.shape[0]))
+    print("{0:<75} {1:>9} {2:>9} {3:>8}".format("settings", "PIL (s)", "native", "max diff"))
+    for settings in SETTINGS:
+        processor = EnhanceProcessor(**settings)
+        expected, result = pil_enhance(page, **settings), processor.process(page.image)
+        difference = numpy.abs(expected.astype(int) - result.astype(int)).max()
+        pil = min(timeit.repeat(lambda: pil_enhance(page, **settings), number=1, repeat=args.repeat))
+        native = min(timeit.repeat(lambda: processor.process(page.image), number=1, repeat=args.repeat))
+        print("{0:<75} {1:>9.4f} {2:>9.4f} {3:>8}".format(str(sorted(settings.items())), pil, native, difference))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""
+Compares the time and the lines found by LineFinder's line methods, on the
+bundled data and on synthetic pages made by stacking a bundled image.
+Run with: python -m benchmarks.line_finder
+"""
+from __future__ import print_function
+import timeit
+import numpy
+from simpleocr.files import open_image
+from simpleocr.segmentation import ContourSegmenter
+from simpleocr.segmentation_aux import LineFinder
+
+LINE_METHODS = ["kmeans", "projection"]
+
+
+def segments_before_line_finder(image):
+    """returns the segments the default ContourSegmenter feeds to its LineFinder"""
+    segmenter = ContourSegmenter(blur_x=5, blur_y=5)
+    segments = image
+    for processor in segmenter.processors:
+        if isinstance(processor, LineFinder):
+            return segments
+        segments = processor.process(segments)
+
+
+def compare(name, image, repeat=3):
+    segments = segments_before_line_finder(image)
+    results = {}
+    for method in LINE_METHODS:
+        finder = LineFinder(line_method=method)
+        seconds = min(timeit.repeat(lambda: finder.process(segments), number=1, repeat=repeat))
+        results[method] = finder.lines_topmiddlebottoms
+        print("{0:>12} {1:>6} segments {2:>11}: {3:8.2f} ms, {4} lines".format(
+            name, len(segments), method, seconds * 1000, len(finder.lines_tops)))
+    a, b = results["kmeans"], results["projection"]
+    if a.shape == b.shape:
+        print("{0:>12} max difference between line positions: {1:.2f} px".format(name, numpy.max(numpy.abs(a - b))))
+    else:
+        print("{0:>12} different number of lines".format(name))
+
+
+def main():
+    for name in ("digits1", "digits2", "unicode1"):
+        compare(name, open_image(name).image)
+    image = open_image("digits2").image
+    for copies in (2, 5):
+        compare("digits2 x{0}".format(copies), numpy.vstack([image] * copies))
+
+
+if __name__ == "__main__":
+    main()
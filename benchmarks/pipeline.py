@@ -0,0 +1,139 @@
+"""
+Benchmarks every stage of the OCR pipeline: each processor of ContourSegmenter,
+SimpleFeatureExtractor.extract, KNNClassifier.train/classify and OCR.ocr.
+Runs on the bundled data and on synthetic pages with 10x/100x its glyphs, and
+reports wall time, throughput and peak (python-allocated) memory.
+Run with: python -m benchmarks.pipeline [--output results.json] [--compare old.json]
+"""
+from __future__ import print_function
+import argparse
+import json
+import sys
+import timeit
+import numpy
+from simpleocr.files import open_image, Image
+from simpleocr.segmentation import ContourSegmenter, SEGMENT_DATATYPE
+from simpleocr.feature_extraction import SimpleFeatureExtractor
+from simpleocr.classification import KNNClassifier
+from simpleocr.ocr import OCR
+
+try:
+    import tracemalloc
+except ImportError:  # python 2
+    tracemalloc = None
+
+BUNDLED = ["digits1", "digits2", "unicode1"]
+SCALED_FROM = "digits2"
+SCALES = [10, 100]
+
+
+def scaled_page(name, scale):
+    """returns a grounded Image tiling the bundled image name scale times, with its ground replicated"""
+    source = open_image(name)
+    cols = max(c for c in range(1, int(scale ** 0.5) + 1) if scale % c == 0)
+    rows = scale // cols
+    h, w = source.image.shape[:2]
+    image = Image(numpy.tile(source.image, (rows, cols, 1)))
+    segments, classes = source.ground.segments, source.ground.classes
+    offsets = numpy.array([(c * w, r * h, 0, 0) for r in range(rows) for c in range(cols)], dtype=SEGMENT_DATATYPE)
+    image.set_ground((segments[numpy.newaxis] + offsets[:, numpy.newaxis]).reshape(-1, 4),
+                     numpy.tile(classes, (scale, 1)))
+    return image
+
+
+def measure(function, repeat):
+    """returns (result, best wall time in seconds, peak python memory in bytes) of calling function"""
+    seconds = []
+    for _ in range(repeat):
+        start = timeit.default_timer()
+        result = function()
+        seconds.append(timeit.default_timer() - start)
+    peak = None
+    if tracemalloc is not None:  # measured on a separate call, tracing slows things down
+        tracemalloc.start()
+        function()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result, min(seconds), peak
+
+
+def benchmark_page(page_name, image, line_method, repeat):
+    """returns a list of result dicts, one per pipeline stage"""
+    results = []
+
+    def record(stage, function, segments):
+        result, seconds, peak = measure(function, repeat)
+        results.append({"page": page_name, "stage": stage, "segments": segments, "seconds": seconds,
+                        "segments_per_second": segments / seconds if seconds else None,
+                        "peak_memory_bytes": peak, "line_method": line_method})
+        return result
+
+    glyphs = len(image.ground.segments)
+    segmenter = ContourSegmenter(blur_x=5, blur_y=5, line_method=line_method)
+    data = image.image
+    for processor in segmenter.processors:
+        # image stages are measured by the glyphs on the page, segment stages by their input
+        n = glyphs if isinstance(data, numpy.ndarray) and data.ndim == 3 else len(data)
+        data = record(processor.__class__.__name__, lambda: processor.process(data), n)
+    segments = data
+
+    extractor = SimpleFeatureExtractor()
+    features = record("SimpleFeatureExtractor.extract", lambda: extractor.extract(image.image, segments),
+                      len(segments))
+    ground_features = extractor.extract(image.image, image.ground.segments)
+    classifier = KNNClassifier()
+
+    def train():
+        classifier.train(ground_features, image.ground.classes)
+        classifier.classify(ground_features[:1])  # the opencv model is only built on the first classify
+
+    record("KNNClassifier.train", train, glyphs)
+    record("KNNClassifier.classify", lambda: classifier.classify(features), len(features))
+
+    ocr = OCR(segmenter, extractor, classifier)
+    record("OCR.ocr", lambda: ocr.ocr(image), glyphs)
+    return results
+
+
+def print_results(results, previous=None):
+    previous = dict(((r["page"], r["stage"]), r) for r in previous or [])
+    for r in results:
+        line = "{page:>14} {stage:>30} {segments:>7} segs {ms:10.2f} ms {sps:12.0f} segs/s".format(
+            ms=r["seconds"] * 1000, sps=r["segments_per_second"] or 0, **r)
+        if r["peak_memory_bytes"] is not None:
+            line += " {0:9.1f} MiB".format(r["peak_memory_bytes"] / 2.0 ** 20)
+        old = previous.get((r["page"], r["stage"]))
+        if old:
+            line += "   x{0:.2f} time vs previous".format(r["seconds"] / old["seconds"])
+        print(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--output", help="write results to this JSON file")
+    parser.add_argument("--compare", help="JSON file from a previous run, to compare with")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per stage; the fastest is reported")
+    parser.add_argument("--scales", type=int, nargs="*", default=SCALES, help="glyph multipliers of synthetic pages")
+    args = parser.parse_args(argv)
+
+    results = []
+    for name in BUNDLED:
+        results += benchmark_page(name, open_image(name), "kmeans", args.repeat)
+    for scale in args.scales:
+        # kmeans line finding is limited to 50 lines, which the larger pages exceed
+        page = scaled_page(SCALED_FROM, scale)
+        results += benchmark_page("{0}x{1}".format(SCALED_FROM, scale), page, "projection", args.repeat)
+
+    previous = None
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)["results"]
+    print_results(results, previous)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"python": sys.version.split()[0], "numpy": numpy.__version__,
+                       "results": results}, f, indent=1, sort_keys=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Measures the effect of a PCAProjection between the extractor and the classifier:
+classification time and model memory against accuracy, for several feature
+sizes and numbers of components. Trains on (a tiled) digits1 and tests on digits2.
+Run with: python -m benchmarks.projection
+"""
+from __future__ import print_function
+import argparse
+import timeit
+from simpleocr.files import open_image
+from simpleocr.feature_extraction import SimpleFeatureExtractor, PCAProjection
+from simpleocr.classification import KNNClassifier
+from simpleocr.ocr import OCR, accuracy
+from benchmarks.pipeline import scaled_page
+
+FEATURE_SIZES = [10, 20, 32]
+COMPONENTS = [None, 32, 16, 8, 4]
+
+
+def model_bytes(ocr):
+    """returns the bytes of the arrays a trained OCR keeps: its samples, projection and the samples it's fitted on"""
+    arrays = list(ocr.classifier.get_samples())
+    if ocr.projection is not None:
+        arrays += list(ocr.projection.get_arrays().values())
+    for block in ocr._projection_samples or []:
+        arrays += list(block)
+    return sum(a.nbytes for a in arrays)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--scale", type=int, default=20, help="copies of the training and test pages")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+    train_page, test_page = scaled_page("digits1", args.scale), scaled_page("digits2", args.scale)
+    test_image = open_image("digits2")
+    for feature_size in FEATURE_SIZES:
+        extractor = SimpleFeatureExtractor(feature_size=feature_size)
+        test_features = extractor.extract(test_page.image, test_page.ground.segments)
+        for components in COMPONENTS:
+            projection = PCAProjection(components) if components else None
+            ocr = OCR(extractor=extractor, classifier=KNNClassifier(), projection=projection)
+            ocr.train(train_page)
+            refittable_bytes = model_bytes(ocr)
+            if projection:
+                ocr.fit_projection()
+            features = projection.project(test_features) if projection else test_features
+            ocr.classifier.classify(features[:1])  # builds the model
+            seconds = min(timeit.repeat(lambda: ocr.classifier.classify(features), number=1, repeat=args.repeat))
+            if projection:  # the projection is part of the classification cost
+                seconds += min(timeit.repeat(lambda: projection.project(test_features), number=1,
+                                             repeat=args.repeat))
+            _, classes, _ = ocr.ocr(test_image)
+            result = "{0:>3} px {1:>9} dims: classify {2:8.1f} ms for {3} glyphs, model {4:7.1f} KiB " \
+                     "({5:7.1f} KiB before fit_projection)".format(
+                         feature_size, features.shape[1], seconds * 1000, len(features), model_bytes(ocr) / 1024.0,
+                         refittable_bytes / 1024.0)
+            try:
+                result += ", accuracy {0:.1%}".format(accuracy(test_image.ground.classes, classes))
+            except Exception:  # segmentation found a different number of glyphs
+                result += ", accuracy n/a ({0} glyphs found)".format(len(classes))
+            print(result)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+Compares the sustained frames per second of FrameOCR (after its first, whole, frame) and of
+OCR.ocr on whole frames, on frame sequences where one glyph changes per frame, for growing frame sizes.
+Run with: python -m benchmarks.video
+"""
+from __future__ import print_function
+import argparse
+from timeit import default_timer
+import numpy
+from simpleocr.classification import KNNClassifier
+from simpleocr.feature_extraction import SimpleFeatureExtractor
+from simpleocr.files import open_image, Image
+from simpleocr.ocr import OCR
+from simpleocr.segmentation import ContourSegmenter
+from simpleocr.video import FrameOCR
+from benchmarks.pipeline import scaled_page, SCALED_FROM
+
+SCALES = [1, 4, 16]
+
+
+def changing_frames(page, n, seed=0):
+    """returns n frames of page where, one frame at a time, a glyph is replaced by another of about its width"""
+    segments = page.ground.segments.astype(int)
+    random = numpy.random.RandomState(seed)
+    frames = [page.image]
+    for _ in range(n - 1):
+        frame = frames[-1].copy()
+        x, y, w, h = segments[random.randint(len(segments))]
+        xs, ys, _, hs = segments[random.choice(numpy.flatnonzero(abs(segments[:, 2] - w) <= 2))]
+        frame[y - 2:y + h + 2, x - 1:x + w + 1] = 255
+        frame[y:y + hs, x:x + w] = page.image[ys:ys + hs, xs:xs + w]
+        frames.append(frame)
+    return frames
+
+
+def frames_per_second(function, frames):
+    start = default_timer()
+    for frame in frames:
+        function(frame)
+    return len(frames) / (default_timer() - start)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--frames", type=int, default=30)
+    args = parser.parse_args(argv)
+    ocr = OCR(ContourSegmenter(blur_y=5, blur_x=5, line_method="projection"), SimpleFeatureExtractor(),
+              KNNClassifier())
+    ocr.train(open_image("digits1"))
+    print("{0:>12} {1:>10} {2:>12} {3:>8}".format("frame", "whole fps", "FrameOCR fps", "whole"))
+    for scale in SCALES:
+        frames = changing_frames(scaled_page(SCALED_FROM, scale), args.frames)
+        whole = frames_per_second(lambda frame: ocr.ocr(Image(frame)), frames)
+        frame_ocr = FrameOCR(ocr)
+        frame_ocr.ocr(frames[0])
+        processed_whole = []
+
+        def streamed(frame):
+            frame_ocr.ocr(frame)
+            processed_whole.append(frame_ocr.regions is None)
+        streaming = frames_per_second(streamed, frames[1:])
+        size = "{0}x{1}".format(frames[0].shape[1], frames[0].shape[0])
+        print("{0:>12} {1:>10.1f} {2:>12.1f} {3:>8}".format(size, whole, streaming, sum(processed_whole)))
+
+
+if __name__ == "__main__":
+    main()
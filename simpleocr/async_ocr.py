@@ -0,0 +1,169 @@
+"""
+An asyncio facade over OCR, running the (blocking) ocr calls on a pool of workers.
+This module needs python 3, so it isn't imported by the package's __init__.
+"""
+import asyncio
+import collections
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from . import ocr as ocr_module
+
+_thread_worker = threading.local()  # the OCR copy of each thread worker
+
+
+def _init_thread_worker(ocr):
+    # the classifiers are shared, so the model's memory doesn't grow with the workers
+    _thread_worker.ocr = ocr._thread_copy()
+
+
+def _thread_ocr(image_file):
+    return _thread_worker.ocr.ocr(image_file)
+
+
+def _process_ocr(image_file):
+    return ocr_module._batch_worker_ocr.ocr(image_file)
+
+
+class AsyncOCR(object):
+    """
+    Runs OCR.ocr on a pool of threads or processes, without blocking the event loop.
+    At most max_pending calls are submitted to the pool at a time; further calls wait
+    (in the event loop) for one of them to finish, so a slow pool pushes back on callers.
+    Cancelling a call that didn't start yet removes it from the pool's queue; a call
+    that already started runs to completion (keeping its place among the max_pending),
+    but its result is discarded.
+    """
+    def __init__(self, ocr, workers=None, executor="thread", max_pending=None, timeout=None):
+        """
+        :param ocr: a trained OCR. Each worker process gets a copy of it when it starts; worker
+        threads get copies of its segmenter and extractors, and share its classifiers
+        :param workers: number of worker threads or processes (defaults to the number of CPUs)
+        :param executor: "thread" or "process". opencv releases the GIL, so threads usually suffice
+        :param max_pending: maximum number of calls submitted to the pool at a time (defaults to 2 * workers)
+        :param timeout: default timeout of each call, in seconds (None waits forever)
+        """
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending or 2 * self.workers
+        self.timeout = timeout
+        ocr._update_projection()  # once, instead of on each worker
+        if executor == "thread":
+            # fitted once, here, so that the threads sharing them don't fit them concurrently
+            ocr.classifier._update_model()
+            if ocr.cascade is not None:
+                ocr.cascade.classifier._update_model()
+            self._executor = ThreadPoolExecutor(self.workers, initializer=_init_thread_worker, initargs=(ocr,))
+            self._function = _thread_ocr
+        elif executor == "process":
+            self._executor = ProcessPoolExecutor(self.workers, initializer=ocr_module._init_batch_worker,
+                                                 initargs=(ocr,))
+            self._function = _process_ocr
+        else:
+            raise ValueError("executor must be 'thread' or 'process', not {0!r}".format(executor))
+        self._semaphore = None  # created on first use, in the running event loop
+        self._pending = 0
+        self._waiting = 0
+
+    @property
+    def queue_depth(self):
+        """the number of calls submitted to the pool (queued or running) and waiting to be submitted"""
+        return {"pending": self._pending, "waiting": self._waiting}
+
+    async def ocr(self, image_file, timeout=None):
+        """
+        returns OCR.ocr(image_file) as (chars, classes, segments).
+        Raises asyncio.TimeoutError if it takes longer than timeout (or the default timeout),
+        counting the time waiting for the pool
+        """
+        timeout = self.timeout if timeout is None else timeout
+        return await asyncio.wait_for(self._ocr(image_file), timeout)
+
+    __call__ = ocr
+
+    async def _ocr(self, image_file):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_pending)
+        self._waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self._waiting -= 1
+        self._pending += 1
+        try:
+            future = self._executor.submit(self._function, image_file)
+        except BaseException:
+            self._release()
+            raise
+        # a timed out (or cancelled) call that already started keeps its slot until it finishes,
+        # so that the pool's queue never holds more than max_pending calls
+        future.add_done_callback(functools.partial(self._call_done, asyncio.get_running_loop()))
+        return await asyncio.wrap_future(future)
+
+    def _call_done(self, loop, future):
+        # runs on the worker (or on the event loop, if the call was cancelled before starting)
+        try:
+            loop.call_soon_threadsafe(self._release)
+        except RuntimeError:  # the event loop was closed
+            pass
+
+    def _release(self):
+        self._pending -= 1
+        self._semaphore.release()
+
+    async def ocr_stream(self, image_files, ordered=True, timeout=None):
+        """
+        Asynchronous generator of the results of many images, given as a (synchronous or
+        asynchronous) iterable. Only max_pending images are taken from image_files ahead of the results.
+        :param ordered: if True, results are yielded in the order of image_files, as
+        (chars, classes, segments). Otherwise they're yielded as they finish, as
+        (index, (chars, classes, segments)), where index is the position in image_files
+        """
+        tasks = collections.deque() if ordered else set()
+        try:
+            index = 0
+            async for image_file in _aiter(image_files):
+                task = asyncio.ensure_future(self._indexed(index, image_file, timeout))
+                index += 1
+                if ordered:
+                    tasks.append(task)
+                    if len(tasks) >= self.max_pending:
+                        yield (await tasks.popleft())[1]
+                else:
+                    tasks.add(task)
+                    if len(tasks) >= self.max_pending:
+                        done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                        for t in done:
+                            yield t.result()
+            while tasks:
+                if ordered:
+                    yield (await tasks.popleft())[1]
+                else:
+                    done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                    for t in done:
+                        yield t.result()
+        finally:
+            for t in tasks:  # the consumer stopped early, or a call failed
+                t.cancel()
+
+    async def _indexed(self, index, image_file, timeout):
+        return index, await self.ocr(image_file, timeout)
+
+    def close(self, wait=True):
+        """shuts down the worker pool"""
+        self._executor.shutdown(wait=wait)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close(wait=False)
+
+
+async def _aiter(iterable):
+    if hasattr(iterable, "__aiter__"):
+        async for item in iterable:
+            yield item
+    else:
+        for item in iterable:
+            yield item
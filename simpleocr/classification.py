@@ -40,38 +40,333 @@ class Classifier(object):
     @staticmethod
     def _filter_unclassified(features, classes):
         classified = (classes != classes_to_numpy(BLANK_CLASS)).reshape(-1)
+        if numpy.all(classified):
+            return features, classes  # avoid copying (possibly memory-mapped) arrays
         return features[classified], classes[classified]
 
+    def add_samples(self, features, classes):
+        """adds classified feature vectors to the ones the classifier was already trained with"""
+        raise NotImplementedError()
+
     def classify(self, features):
         """returns the classes of the feature vectors"""
         raise NotImplementedError
 
+    def classify_with_distances(self, features):
+        """
+        returns the classes of the feature vectors, and a column with the squared
+        distance of each one to its nearest training sample (lower is more confident)
+        """
+        raise NotImplementedError
 
-class KNNClassifier(Classifier):
-    def __init__(self, k=1, debug=False):
-        if get_opencv_version() >= 3:
-            self.knn = cv2.ml.KNearest_create()
-        else:
-            self.knn = cv2.KNearest()
-        self.k = k
-        self.debug = debug
+    def get_samples(self):
+        """returns the (features, classes) the classifier was trained with"""
+        raise NotImplementedError
 
-    def train(self, features, classes):
+    def get_parameters(self):
+        """returns a dictionary with the arguments needed to create an equivalent (untrained) classifier"""
+        raise NotImplementedError
+
+
+def _grow(array, used, capacity):
+    """returns a array with room for capacity rows, with the first used rows of array"""
+    grown = numpy.empty((capacity,) + array.shape[1:], dtype=array.dtype)
+    grown[:used] = array[:used]
+    return grown
+
+
+def vote(neighbour_classes):
+    """
+    given a matrix with the classes of each query's neighbours (a row per query,
+    nearest first), returns a column with the most common class in each row.
+    Ties are won by the class of the nearest neighbour
+    """
+    same = neighbour_classes[:, :, numpy.newaxis] == neighbour_classes[:, numpy.newaxis, :]
+    votes = numpy.sum(same, axis=2)
+    winner = numpy.argmax(votes, axis=1)  # first maximum, so the nearest among ties
+    return neighbour_classes[numpy.arange(len(neighbour_classes)), winner].reshape(-1, 1)
+
+
+def _k_nearest(distances, indexes, k):
+    """given (distance, index) candidates per query (rows), returns the k nearest, sorted by distance"""
+    if distances.shape[1] > k:
+        nearest = numpy.argpartition(distances, k - 1, axis=1)[:, :k]
+        distances = numpy.take_along_axis(distances, nearest, axis=1)
+        indexes = numpy.take_along_axis(indexes, nearest, axis=1)
+    order = numpy.argsort(distances, axis=1, kind="mergesort")
+    return numpy.take_along_axis(distances, order, axis=1), numpy.take_along_axis(indexes, order, axis=1)
+
+
+class SampleClassifier(Classifier):
+    """
+    A classifier that keeps its training samples (like k-nearest neighbours does).
+    Samples can be added incrementally; the model is (re)built from them lazily, by _fit,
+    on the next classify.
+    """
+    UNPICKLED_ATTRIBUTES = ()  # model attributes that are rebuilt after unpickling
+
+    def __init__(self):
+        # training samples. the buffers may have more rows than _n_samples, to allow cheap add_samples
+        self._features, self._classes, self._n_samples = None, None, 0
+        self._trained = True  # False when the model is outdated with respect to the samples
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for name in self.UNPICKLED_ATTRIBUTES:
+            state.pop(name, None)
+        state["_features"], state["_classes"] = self.get_samples()
+        state["_trained"] = self._features is None
+        return state
+
+    @staticmethod
+    def _prepare_samples(features, classes):
         if FEATURE_DATATYPE != numpy.float32:
             features = numpy.asarray(features, dtype=numpy.float32)
         if CLASS_DATATYPE != numpy.float32:
             classes = numpy.asarray(classes, dtype=numpy.float32)
-        features, classes = Classifier._filter_unclassified(features, classes)
+        return Classifier._filter_unclassified(features, classes)
+
+    def train(self, features, classes):
+        """trains with the given samples only, discarding previous ones"""
+        features, classes = self._prepare_samples(features, classes)
+        self._features, self._classes, self._n_samples = features, classes, len(features)
+        self._trained = False
+
+    def add_samples(self, features, classes):
+        """
+        Adds samples to the training set. The sample buffers grow geometrically, so
+        adding many small sets is amortized linear. The model is only rebuilt
+        on the next classify.
+        """
+        if self._features is None:
+            return self.train(features, classes)
+        features, classes = self._prepare_samples(features, classes)
+        n, added = self._n_samples, len(features)
+        if not added:  # the buffers may be read-only (memory-mapped, as loaded by OCR.load) until grown
+            return
+        if n + added > len(self._features):
+            capacity = max(n + added, 2 * len(self._features))
+            self._features = _grow(self._features, n, capacity)
+            self._classes = _grow(self._classes, n, capacity)
+        self._features[n:n + added] = features
+        self._classes[n:n + added] = classes
+        self._n_samples = n + added
+        self._trained = False
+
+    def get_samples(self):
+        if self._features is None:
+            return None, None
+        n = self._n_samples
+        return self._features[:n], self._classes[:n]
+
+    def _fit(self, features, classes):
+        """builds the model from the training samples"""
+        raise NotImplementedError()
+
+    def _update_model(self):
+        if not self._trained:
+            self._fit(*self.get_samples())
+            self._trained = True
+
+    @staticmethod
+    def _prepare_features(features):
+        if FEATURE_DATATYPE != numpy.float32:
+            features = numpy.asarray(features, dtype=numpy.float32)
+        return features
+
+
+class KNNClassifier(SampleClassifier):
+    """k-nearest neighbours, using opencv's KNearest"""
+    UNPICKLED_ATTRIBUTES = ("knn",)  # the opencv model can't be pickled
+
+    def __init__(self, k=1, debug=False):
+        SampleClassifier.__init__(self)
+        self.knn = self._create_knn()
+        self.k = k
+        self.debug = debug
+
+    @staticmethod
+    def _create_knn():
+        if get_opencv_version() >= 3:
+            return cv2.ml.KNearest_create()
+        else:
+            return cv2.KNearest()
+
+    def get_parameters(self):
+        return {"k": self.k}
+
+    def _fit(self, features, classes):
+        self.knn = self._create_knn()
         if get_opencv_version() >= 3:
             self.knn.train(features, cv2.ml.ROW_SAMPLE, classes)
         else:
             self.knn.train(features, classes)
 
     def classify(self, features):
-        if FEATURE_DATATYPE != numpy.float32:
-            features = numpy.asarray(features, dtype=numpy.float32)
+        return self.classify_with_distances(features)[0]
+
+    def classify_with_distances(self, features):
+        self._update_model()
+        features = self._prepare_features(features)
         if get_opencv_version() >= 3:
-            retval, result_classes, neigh_resp, dists = self.knn.findNearest(features, k=1)
+            retval, result_classes, neigh_resp, dists = self.knn.findNearest(features, k=self.k)
         else:
-            retval, result_classes, neigh_resp, dists = self.knn.find_nearest(features, k=1)
-        return result_classes
+            retval, result_classes, neigh_resp, dists = self.knn.find_nearest(features, k=self.k)
+        return result_classes, dists[:, :1]
+
+
+class BruteForceKNNClassifier(SampleClassifier):
+    """
+    k-nearest neighbours, comparing each feature vector with all samples, in numpy.
+    Queries are processed in blocks, so the distance matrix of a block (along with the copy
+    and the indexes argpartition makes of it) takes at most max_block_bytes. Distances are
+    computed with a matrix product (BLAS) in float32; the nearest candidates are then re-ranked
+    with exact distances.
+    """
+    EXTRA_CANDIDATES = 8  # candidates beyond k re-ranked with exact distances, to absorb float32 rounding
+
+    def __init__(self, k=1, max_block_bytes=2 ** 26):
+        SampleClassifier.__init__(self)
+        self.k = k
+        self.max_block_bytes = max_block_bytes
+
+    def get_parameters(self):
+        return {"k": self.k, "max_block_bytes": self.max_block_bytes}
+
+    UNPICKLED_ATTRIBUTES = ("_squared_norms",)
+
+    def _fit(self, features, classes):
+        self._squared_norms = numpy.einsum("ij,ij->i", features, features)
+
+    def _nearest(self, features):
+        """returns the (squared distances, sample indexes) of the k nearest samples of each feature vector"""
+        samples, _ = self.get_samples()
+        n = len(samples)
+        k = min(self.k, n)
+        candidates = min(k + self.EXTRA_CANDIDATES, n)
+        # per query: a float32 distance per sample, argpartition's copy of them, and their intp indexes
+        block = max(1, self.max_block_bytes // ((4 + 4 + 8) * n))
+        distances = numpy.empty((len(features), k), dtype=numpy.float64)
+        indexes = numpy.empty((len(features), k), dtype=numpy.intp)
+        for start in range(0, len(features), block):
+            queries = features[start:start + block]
+            # |q-s|^2 = |s|^2 - 2 q.s + |q|^2 ; |q|^2 doesn't change the ranking of a row
+            approximate = numpy.dot(queries, samples.T)
+            approximate *= -2
+            approximate += self._squared_norms
+            nearest = numpy.argpartition(approximate, candidates - 1, axis=1)[:, :candidates].copy()  # frees the rest
+            difference = samples[nearest].astype(numpy.float64) - queries[:, numpy.newaxis, :]
+            exact = numpy.einsum("ijk,ijk->ij", difference, difference)
+            distances[start:start + block], indexes[start:start + block] = _k_nearest(exact, nearest, k)
+        return distances, indexes
+
+    def classify(self, features):
+        return self.classify_with_distances(features)[0]
+
+    def classify_with_distances(self, features):
+        self._update_model()
+        features = self._prepare_features(features)
+        distances, indexes = self._nearest(features)
+        _, classes = self.get_samples()
+        return vote(classes[indexes, 0]), distances[:, :1]
+
+
+class KDTreeKNNClassifier(SampleClassifier):
+    """
+    k-nearest neighbours over a k-d tree of the samples. Best for low dimensional
+    features (a small feature_size), where the tree prunes most samples.
+    Queries are processed leaf by leaf, with numpy: first on the leaf they fall in,
+    then on every other leaf closer than their current k-th nearest sample.
+    """
+    UNPICKLED_ATTRIBUTES = ("_points", "_point_indexes", "_node_dims", "_node_values", "_node_children",
+                            "_node_leaves", "_leaves", "_leaf_low", "_leaf_high")
+
+    def __init__(self, k=1, leaf_size=64):
+        SampleClassifier.__init__(self)
+        self.k = k
+        self.leaf_size = leaf_size
+
+    def get_parameters(self):
+        return {"k": self.k, "leaf_size": self.leaf_size}
+
+    def _fit(self, features, classes):
+        """builds the tree. Leaves are contiguous ranges of the reordered samples"""
+        n = len(features)
+        order = numpy.arange(n)
+        dims, values, children, node_leaves = [], [], [], []  # per node. leaf nodes have dimension -1
+        leaves = []  # (start, end) of each leaf
+        pending = [(0, n, -1, 0)]  # (start, end, parent node, child number)
+        while pending:
+            start, end, parent, child = pending.pop()
+            node = len(dims)
+            if parent >= 0:
+                children[parent][child] = node
+            points = features[order[start:end]]
+            if end - start > self.leaf_size:
+                spread = points.max(axis=0) - points.min(axis=0)
+            if end - start <= self.leaf_size or not numpy.any(spread):
+                dims.append(-1), values.append(0.0), children.append([-1, -1]), node_leaves.append(len(leaves))
+                leaves.append((start, end))
+                continue
+            dim = int(numpy.argmax(spread))
+            middle = (end - start) // 2
+            order[start:end] = order[start:end][numpy.argpartition(points[:, dim], middle)]
+            dims.append(dim), values.append(features[order[start + middle], dim])
+            children.append([-1, -1]), node_leaves.append(-1)
+            pending.append((start, start + middle, node, 0))
+            pending.append((start + middle, end, node, 1))
+        self._point_indexes = order
+        self._points = features[order].astype(numpy.float64)
+        self._node_dims, self._node_values = numpy.array(dims, dtype=numpy.intp), numpy.array(values)
+        self._node_children = numpy.array(children, dtype=numpy.intp)
+        self._node_leaves = numpy.array(node_leaves, dtype=numpy.intp)
+        self._leaves = numpy.array(leaves, dtype=numpy.intp).reshape(-1, 2)
+        self._leaf_low = numpy.array([self._points[s:e].min(axis=0) for s, e in leaves])
+        self._leaf_high = numpy.array([self._points[s:e].max(axis=0) for s, e in leaves])
+
+    def _leaf_of(self, queries):
+        """descends the tree, returning the index of the leaf each query falls in"""
+        node = numpy.zeros(len(queries), dtype=numpy.intp)
+        q = numpy.flatnonzero(self._node_dims[node] >= 0)
+        while len(q):
+            dims = self._node_dims[node[q]]
+            go_right = queries[q, dims] >= self._node_values[node[q]]
+            node[q] = self._node_children[node[q], go_right.astype(numpy.intp)]
+            q = q[self._node_dims[node[q]] >= 0]
+        return self._node_leaves[node]
+
+    def _search_leaf(self, leaf, queries, q, distances, indexes, k):
+        start, end = self._leaves[leaf]
+        difference = self._points[start:end] - queries[q][:, numpy.newaxis, :]
+        d = numpy.einsum("ijk,ijk->ij", difference, difference)
+        i = numpy.broadcast_to(numpy.arange(start, end), d.shape)
+        d, i = numpy.concatenate((distances[q], d), axis=1), numpy.concatenate((indexes[q], i), axis=1)
+        distances[q], indexes[q] = _k_nearest(d, i, k)
+
+    def _nearest(self, features):
+        n = self._n_samples
+        k = min(self.k, n)
+        queries = features.astype(numpy.float64)
+        distances = numpy.full((len(queries), k), numpy.inf)
+        indexes = numpy.zeros((len(queries), k), dtype=numpy.intp)
+        home = self._leaf_of(queries)
+        for leaf in numpy.unique(home):
+            self._search_leaf(leaf, queries, numpy.flatnonzero(home == leaf), distances, indexes, k)
+        for leaf in range(len(self._leaves)):
+            # squared distance from each query to the leaf's bounding box
+            outside = numpy.maximum(self._leaf_low[leaf] - queries, 0) + numpy.maximum(queries - self._leaf_high[leaf], 0)
+            box_distance = numpy.einsum("ij,ij->i", outside, outside)
+            q = numpy.flatnonzero((box_distance < distances[:, -1]) & (home != leaf))
+            if len(q):
+                self._search_leaf(leaf, queries, q, distances, indexes, k)
+        return distances, self._point_indexes[indexes]
+
+    def classify(self, features):
+        return self.classify_with_distances(features)[0]
+
+    def classify_with_distances(self, features):
+        self._update_model()
+        features = self._prepare_features(features)
+        distances, indexes = self._nearest(features)
+        _, classes = self.get_samples()
+        return vote(classes[indexes, 0]), distances[:, :1]
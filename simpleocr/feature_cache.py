@@ -0,0 +1,102 @@
+"""An on-disk cache of extracted features, so retraining doesn't extract them again from unchanged files"""
+import errno
+import hashlib
+import json
+import os
+import tempfile
+import numpy
+
+CACHE_EXTENSION = ".npy"
+
+
+def _replace(src, dst):
+    try:
+        os.replace(src, dst)
+    except AttributeError:  # python 2
+        os.rename(src, dst)
+
+
+class FeatureCache(object):
+    """
+    Stores a block of features per (image, segments, extractor) in a directory, as
+    .npy files named by a hash of their contents and the extractor's parameters.
+    When the cache grows beyond max_bytes, the least recently used blocks are deleted.
+    """
+    def __init__(self, directory, max_bytes=2 ** 30):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._total_bytes = None  # computed on first use
+
+    @staticmethod
+    def key(image, segments, extractor):
+        """returns the cache key of the features the extractor gets from image and segments"""
+        h = hashlib.sha1()
+        for array in (numpy.ascontiguousarray(image), numpy.ascontiguousarray(segments)):
+            h.update(str((array.shape, array.dtype.str)).encode("ascii"))
+            h.update(array.data)
+        parameters = [extractor.__class__.__name__, extractor.get_parameters()]
+        h.update(json.dumps(parameters, sort_keys=True).encode("utf-8"))
+        return h.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + CACHE_EXTENSION)
+
+    def _entries(self):
+        """returns (last use time, size, path) of every cached block"""
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(CACHE_EXTENSION):
+                path = os.path.join(self.directory, name)
+                st = os.stat(path)
+                entries.append((st.st_mtime, st.st_size, path))
+        return entries
+
+    def _ensure_directory(self):
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        if self._total_bytes is None:
+            self._total_bytes = sum(size for _, size, _ in self._entries())
+
+    def get(self, key):
+        """returns the cached features, or None"""
+        path = self._path(key)
+        try:
+            features = numpy.load(path)
+            os.utime(path, None)  # mark as recently used
+        except (IOError, OSError) as e:
+            if getattr(e, "errno", None) not in (None, errno.ENOENT):
+                raise
+            return None
+        return features
+
+    def put(self, key, features):
+        self._ensure_directory()
+        fd, temporary = tempfile.mkstemp(suffix=".tmp", dir=self.directory)
+        with os.fdopen(fd, "wb") as f:
+            numpy.save(f, features)
+        _replace(temporary, self._path(key))  # readers never see partial files
+        self._total_bytes += os.path.getsize(self._path(key))
+        if self._total_bytes > self.max_bytes:
+            self._evict()
+
+    def _evict(self):
+        """deletes the least recently used blocks, until the cache is under max_bytes"""
+        entries = sorted(self._entries())
+        self._total_bytes = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if self._total_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:  # removed concurrently
+                pass
+            self._total_bytes -= size
+
+    def extract(self, extractor, image, segments):
+        """returns extractor.extract(image, segments), from the cache if possible"""
+        key = self.key(image, segments, extractor)
+        features = self.get(key)
+        if features is None:
+            features = extractor.extract(image, segments)
+            self.put(key, features)
+        return features
@@ -1,7 +1,7 @@
 import numpy
 import cv2
 from .segmentation import region_from_segment
-from .opencv_utils import background_color
+from .opencv_utils import image_context
 
 FEATURE_DATATYPE = numpy.float32
 # FEATURE_SIZE is defined on the specific feature extractor instance
@@ -11,35 +11,123 @@ FEATURES_DIRECTION = 0  # vertical - ROWS of feature vectors
 
 class FeatureExtractor(object):
     """given a list of segments, returns a list of feature vectors"""
+    ACCEPTS_CONTEXT = False  # whether extract() takes a ImageContext, instead of a image
+
     def extract(self, image, segments):
         raise NotImplementedError()
 
+    def get_parameters(self):
+        """returns a dictionary with the arguments needed to create an equivalent extractor"""
+        raise NotImplementedError()
+
 
 class SimpleFeatureExtractor(FeatureExtractor):
+    ACCEPTS_CONTEXT = True
+
     def __init__(self, feature_size=10, stretch=False):
         self.feature_size = feature_size
         self.stretch = stretch
 
+    def get_parameters(self):
+        return {"feature_size": self.feature_size, "stretch": self.stretch}
+
+    def _resized_shapes(self, segments):
+        """returns the (height, width) each segment region is resized to, as two integer columns"""
+        n, fs = len(segments), self.feature_size
+        if self.stretch:
+            return numpy.full(n, fs, dtype=int), numpy.full(n, fs, dtype=int)
+        w = segments[:, 2].astype(numpy.float64)
+        h = segments[:, 3].astype(numpy.float64)
+        proportion = numpy.minimum(h, w) / numpy.maximum(w, h)
+        small = (fs * proportion).astype(int)
+        wide = h <= w  # the smaller side is the height
+        heights = numpy.where(wide, small, fs)
+        widths = numpy.where(wide, fs, small)
+        return heights, widths
+
     def extract(self, image, segments):
-        image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        context = image_context(image)
+        image = context.gray
         fs = self.feature_size
-        bg = background_color(image)
-
-        regions = numpy.ndarray(shape=(0, fs), dtype=FEATURE_DATATYPE)
-        for segment in segments:
-            region = region_from_segment(image, segment)
-            if self.stretch:
-                region = cv2.resize(region, (fs, fs))
-            else:
-                x, y, w, h = segment
-                proportion = float(min(h, w)) / max(w, h)
-                new_size = (fs, int(fs * proportion)) if min(w, h) == h else (int(fs * proportion), fs)
-                region = cv2.resize(region, new_size)
-                s = region.shape
-                newregion = numpy.ndarray((fs, fs), dtype=region.dtype)
-                newregion[:, :] = bg
-                newregion[:s[0], :s[1]] = region
-                region = newregion
-            regions = numpy.append(regions, region, axis=0)
-        regions.shape = (len(segments), fs ** 2)
-        return regions
+        n = len(segments)
+        # a single preallocated buffer, already filled with the padding color
+        regions = numpy.empty((n, fs, fs), dtype=FEATURE_DATATYPE)
+        if n == 0:
+            return regions.reshape(0, fs ** 2)
+        if not self.stretch:
+            regions.fill(context.background_color)
+        heights, widths = self._resized_shapes(segments)
+        # group segments by their resized shape, so each group is written with a single array operation
+        keys = heights * (fs + 1) + widths
+        order = numpy.argsort(keys, kind="mergesort")
+        boundaries = numpy.flatnonzero(numpy.diff(keys[order])) + 1
+        for group in numpy.split(order, boundaries):
+            h, w = heights[group[0]], widths[group[0]]
+            block = numpy.empty((len(group), h, w), dtype=image.dtype)
+            for i, segment_index in enumerate(group):
+                region = region_from_segment(image, segments[segment_index])
+                cv2.resize(region, (int(w), int(h)), dst=block[i])
+            regions[group, :h, :w] = block
+        return regions.reshape(n, fs ** 2)
+
+
+class FeatureProjection(object):
+    """
+    A trainable transformation of feature vectors (usually to fewer dimensions),
+    applied between the extractor and the classifier
+    """
+    def fit(self, features):
+        """learns the projection from (training) feature vectors"""
+        raise NotImplementedError()
+
+    @property
+    def is_fitted(self):
+        raise NotImplementedError()
+
+    def project(self, features):
+        """returns the projected feature vectors"""
+        raise NotImplementedError()
+
+    def get_parameters(self):
+        """returns a dictionary with the arguments needed to create an equivalent (unfitted) projection"""
+        raise NotImplementedError()
+
+    def get_arrays(self):
+        """returns a dictionary with the learned arrays, to be restored with set_arrays"""
+        raise NotImplementedError()
+
+    def set_arrays(self, **arrays):
+        raise NotImplementedError()
+
+
+class PCAProjection(FeatureProjection):
+    """projects feature vectors on their n_components principal components"""
+    def __init__(self, n_components=16):
+        self.n_components = n_components
+        self.mean, self.components = None, None
+
+    def fit(self, features):
+        features = numpy.asarray(features, dtype=numpy.float64)
+        self.mean = features.mean(axis=0)
+        centered = features - self.mean
+        covariance = numpy.dot(centered.T, centered) / max(len(features) - 1, 1)
+        eigenvalues, eigenvectors = numpy.linalg.eigh(covariance)  # ascending eigenvalues
+        n = min(self.n_components, len(eigenvalues))
+        self.components = eigenvectors[:, ::-1][:, :n].T.astype(FEATURE_DATATYPE)
+        self.mean = self.mean.astype(FEATURE_DATATYPE)
+
+    @property
+    def is_fitted(self):
+        return self.components is not None
+
+    def project(self, features):
+        return numpy.dot(features - self.mean, self.components.T)
+
+    def get_parameters(self):
+        return {"n_components": self.n_components}
+
+    def get_arrays(self):
+        return {"mean": self.mean, "components": self.components}
+
+    def set_arrays(self, mean, components):
+        self.mean, self.components = mean, components
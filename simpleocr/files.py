@@ -1,7 +1,9 @@
 import os
+import glob
 from pkg_resources import resource_filename
+from six import string_types
 import cv2
-from .tesseract_utils import read_boxfile, write_boxfile
+from .tesseract_utils import read_boxfile, write_boxfile, BOX_SIDECAR_EXTENSION
 
 IMAGE_EXTENSIONS = ['.png', '.tif', '.jpg', '.jpeg']
 DATA_DIRECTORY = resource_filename("simpleocr", "data")
@@ -17,8 +19,32 @@ def try_extensions(extensions, path):
     return None
 
 
-def open_image(path):
-    return ImageFile(get_file_path(path))
+def find_grounded_images(paths_or_glob):
+    """
+    Returns the sorted absolute paths of the images that have a ground (box) file.
+    :param paths_or_glob: a image path, directory (searched recursively) or glob pattern, or a list of those
+    """
+    if isinstance(paths_or_glob, string_types) or not hasattr(paths_or_glob, "__iter__"):
+        paths_or_glob = [paths_or_glob]
+    candidates = []
+    for path in paths_or_glob:
+        if os.path.isdir(path):
+            for directory, _, names in os.walk(path):
+                candidates.extend(os.path.join(directory, name) for name in names)
+        elif os.path.isfile(path):
+            candidates.append(path)
+        else:
+            candidates.extend(glob.glob(path))
+    images = set()
+    for path in candidates:
+        base, extension = os.path.splitext(path)
+        if extension.lower() in IMAGE_EXTENSIONS and any(os.path.exists(base + e) for e in GROUND_EXTENSIONS):
+            images.add(os.path.abspath(path))
+    return sorted(images)
+
+
+def open_image(path, ground_sidecar=False):
+    return ImageFile(get_file_path(path), ground_sidecar=ground_sidecar)
 
 
 def get_file_path(path, ground=False):
@@ -56,17 +82,22 @@ class GroundFile(Ground):
     to a box file so it can be restored when the image file the ground data belongs
     to is opened again.
     """
-    def __init__(self, path, segments, classes):
+    def __init__(self, path, segments, classes, sidecar=False):
+        """
+        :param sidecar: whether to keep a binary copy of the box file (path + BOX_SIDECAR_EXTENSION),
+        which is read instead of the box file while the latter is unchanged
+        """
         Ground.__init__(self, segments, classes)
         self.path = path
+        self.sidecar = sidecar
 
     def read(self):
         """Update the ground data stored by reading the box file from disk"""
-        self.classes, self.segments = read_boxfile(self.path)
+        self.classes, self.segments = read_boxfile(self.path, sidecar=self.sidecar)
 
     def write(self):
         """Write a new box file to disk containing the stored ground data"""
-        write_boxfile(self.path, self.classes, self.segments)
+        write_boxfile(self.path, self.classes, self.segments, sidecar=self.sidecar)
 
 
 class Image(object):
@@ -93,7 +124,7 @@ class Image(object):
 
     @property
     def is_grounded(self):
-        return not (self._ground is None)
+        return not (self.ground is None)
 
     @property
     def ground(self):
@@ -104,36 +135,62 @@ class ImageFile(Image):
     """
     Complete class that contains functions for creation from file.
     Also supports grounding in memory.
+    The image is only decoded, and the ground only read, when they are first accessed.
     """
-    def __init__(self, path):
+    def __init__(self, path, ground_sidecar=False):
         """
         :param path: path to the image to read, must be valid and absolute
+        :param ground_sidecar: whether the ground uses a binary sidecar of its box file (see GroundFile)
         """
         if not os.path.isabs(path):
             raise ValueError("path value is not absolute: {0}".format(path))
-        array = cv2.imread(path)
-        Image.__init__(self, array)
+        Image.__init__(self, None)
         self._path = path
-        basepath = os.path.splitext(path)[0]
-        self._ground_path = try_extensions(GROUND_EXTENSIONS, basepath)
-        if self._ground_path:
-            self._ground = GroundFile(self._ground_path, None, None)
+        self._ground_sidecar = ground_sidecar
+        self._ground_path = None
+        self._ground_loaded = False
+
+    def _load_ground(self):
+        if os.path.exists(self.ground_path):
+            self._ground = GroundFile(self.ground_path, None, None, sidecar=self._ground_sidecar)
             self._ground.read()
         else:
-            self._ground_path = basepath + GROUND_EXTENSIONS_DEFAULT
             self._ground = None
+        self._ground_loaded = True
 
     def set_ground(self, segments, classes, write_file=False):
         """Creates the ground, saves it to a file"""
-        self._ground = GroundFile(self._ground_path, segments=segments, classes=classes)
+        self._ground = GroundFile(self.ground_path, segments=segments, classes=classes,
+                                  sidecar=self._ground_sidecar)
+        self._ground_loaded = True
         if write_file:
             self.ground.write()
 
     def remove_ground(self, remove_file=False):
         """Removes ground, optionally deleting it's file"""
+        ground_path = self.ground_path
         self._ground = None
+        self._ground_loaded = True
         if remove_file:
-            os.remove(self._ground_path)
+            os.remove(ground_path)
+            if os.path.exists(ground_path + BOX_SIDECAR_EXTENSION):
+                os.remove(ground_path + BOX_SIDECAR_EXTENSION)
+
+    def release_image(self):
+        """Frees the decoded image. It is read again from the file if accessed later"""
+        self._image = None
+
+    @property
+    def image(self):
+        if self._image is None:
+            self._image = cv2.imread(self._path)
+        return self._image
+
+    @property
+    def ground(self):
+        if not self._ground_loaded:
+            self._load_ground()
+        return self._ground
 
     @property
     def path(self):
@@ -141,6 +198,8 @@ class ImageFile(Image):
 
     @property
     def ground_path(self):
+        if self._ground_path is None:
+            basepath = os.path.splitext(self._path)[0]
+            self._ground_path = (try_extensions(GROUND_EXTENSIONS, basepath) or
+                                 basepath + GROUND_EXTENSIONS_DEFAULT)
         return self._ground_path
-
-
@@ -1,20 +1,48 @@
 import numpy
-from .opencv_utils import show_image_and_wait_for_key, draw_segments
+import cv2
+import copy
+import multiprocessing
+import threading
+from multiprocessing.pool import ThreadPool
+import json
+import io
+import os
+from .opencv_utils import show_image_and_wait_for_key, draw_segments, ImageContext
 from . import segmentation as segmenters
 from . import classification as classifiers
 from . import feature_extraction as extractors
 from . import grounding as grounders
-from .files import open_image, Image
-from six import unichr
+from .files import open_image, Image, find_grounded_images
+from .classification import CLASS_DATATYPE
+from .segmentation import SEGMENT_DATATYPE
+from .processor import new_stats, update_stats
+from timeit import default_timer
+from six import text_type, unichr
 
 SEGMENTERS = {
     "contour": segmenters.ContourSegmenter,
     "raw": segmenters.RawSegmenter,
     "rawcontour": segmenters.RawContourSegmenter,
+    "tiledcontour": segmenters.TiledContourSegmenter,
+    "pyramidcontour": segmenters.PyramidContourSegmenter,
 }
 EXTRACTORS = {"simple": extractors.SimpleFeatureExtractor}
-CLASSIFIERS = {"knn": classifiers.KNNClassifier}
+CLASSIFIERS = {
+    "knn": classifiers.KNNClassifier,
+    "bruteforce": classifiers.BruteForceKNNClassifier,
+    "kdtree": classifiers.KDTreeKNNClassifier,
+}
 GROUNDERS = {"user": grounders.UserGrounder, "text": grounders.TextGrounder}
+PROJECTIONS = {"pca": extractors.PCAProjection}
+
+MODEL_FORMAT_VERSION = 3  # version 2 adds the (optional) projection, version 3 the (optional) cascade
+MODEL_FORMAT_SUPPORTED_VERSIONS = (1, 2, 3)
+MODEL_FILE = "model.json"
+MODEL_FEATURES_FILE = "features.npy"
+MODEL_CLASSES_FILE = "classes.npy"
+MODEL_PROJECTION_FILE = "projection.npz"
+MODEL_CASCADE_FEATURES_FILE = "cascade_features.npy"
+MODEL_CASCADE_CLASSES_FILE = "cascade_classes.npy"
 
 
 def show_differences(image, segments, ground_classes, result_classes):
@@ -27,7 +55,7 @@ def show_differences(image, segments, ground_classes, result_classes):
 
 
 def reconstruct_chars(classes):
-    result_string = "".join(map(unichr, classes))
+    result_string = "".join(unichr(int(c)) for c in numpy.ravel(classes))
     return result_string
 
 
@@ -38,6 +66,14 @@ def accuracy(expected, result):
     return float(numpy.count_nonzero(correct)) / correct.shape[0]
 
 
+def get_key_of(instance, class_dict):
+    """reverses get_instance_from: gets the key of the instance's class in class_dict"""
+    for k, cls in class_dict.items():
+        if type(instance) is cls:
+            return k
+    raise ValueError("{0} is not registered, and can't be saved".format(instance.__class__.__name__))
+
+
 def get_instance_from(x, class_dict, default_key):
     """Gets a instance of a class, given a class dict and x.
     X can be either a instance (already), the key to the dict, or None.
@@ -48,34 +84,441 @@ def get_instance_from(x, class_dict, default_key):
     return instance
 
 
+class CascadeStage(object):
+    """
+    A cheap first classification stage of a OCR, with its own (usually smaller) features and classifier.
+    Glyphs it classifies confidently keep its class; only the others are extracted
+    and classified by the OCR's extractor (and projection) and classifier.
+    """
+    def __init__(self, extractor=None, classifier=None, max_distance=8.0):
+        """
+        :param extractor: a FeatureExtractor (or key of EXTRACTORS). Defaults to SimpleFeatureExtractor(feature_size=5)
+        :param classifier: a Classifier supporting classify_with_distances (or key of CLASSIFIERS)
+        :param max_distance: a glyph is classified confidently if the root mean square difference
+        between its features and those of the nearest sample is at most max_distance
+        (for SimpleFeatureExtractor, in grayscale levels per pixel)
+        """
+        self.extractor = get_instance_from(extractor, EXTRACTORS, None) or \
+            extractors.SimpleFeatureExtractor(feature_size=5)
+        self.classifier = get_instance_from(classifier, CLASSIFIERS, "knn")
+        self.max_distance = max_distance
+
+    def get_parameters(self):
+        return {"max_distance": self.max_distance}
+
+    def classify(self, features):
+        """returns the classes of the feature vectors, and a boolean array telling which are confident"""
+        classes, distances = self.classifier.classify_with_distances(features)
+        confident = distances[:, 0] <= self.max_distance ** 2 * features.shape[1]
+        return classes, confident
+
+
+_batch_worker_ocr = None  # the OCR instance of a ocr_batch worker process
+
+
+def _init_batch_worker(ocr):
+    """runs once on each worker process, so the trained OCR is only shipped once"""
+    global _batch_worker_ocr
+    _batch_worker_ocr = ocr
+    cv2.setNumThreads(1)  # parallelism comes from the process pool
+
+
+def _batch_worker(indexed_image):
+    i, image_file = indexed_image
+    return i, _batch_worker_ocr.ocr(image_file)
+
+
+def _train_worker(indexed_image):
+    i, image_file = indexed_image
+    return i, _batch_worker_ocr._training_samples(image_file)
+
+
+def _with_capacity(array, like, size):
+    """returns array, or a copy of it with room for at least size rows (shaped as like's), doubling its capacity"""
+    if array is not None and len(array) >= size:
+        return array
+    grown = numpy.empty((max(size, 2 * (0 if array is None else len(array))),) + like.shape[1:], dtype=like.dtype)
+    if array is not None:
+        grown[:len(array)] = array
+    return grown
+
+
+_roi_worker = threading.local()  # the segmenter copy of each roi worker thread
+
+
+def _init_roi_worker(ocr):
+    _roi_worker.ocr = ocr._thread_copy(share_classifier=False)
+
+
+def _roi_segment(image):
+    return _roi_worker.ocr._segment(Image(image))
+
+
 class OCR(object):
-    def __init__(self, segmenter=None, extractor=None, classifier=None, grounder=None):
+    def __init__(self, segmenter=None, extractor=None, classifier=None, grounder=None, lean=False, projection=None,
+                 feature_cache=None, cascade=None):
+        """
+        :param lean: if True, the segmenter doesn't keep images and other intermediate
+        results between calls (see Processor.set_lean), except when ocr is called with show_steps
+        :param projection: optional FeatureProjection (or key of PROJECTIONS) applied to the
+        features before the classifier. It's fitted on the (classified) training samples: after
+        further train calls, it's fitted again on all of them, and they're projected again, before
+        the next classification. So the unprojected samples are kept, until fit_projection fixes
+        the projection. The projection of a loaded OCR (or one given fitted), and of copies
+        (pickled, like those of worker processes), is fixed, since its unprojected samples are unknown
+        :param feature_cache: optional FeatureCache, where train stores the extracted features,
+        so that they're not extracted again from unchanged files
+        :param cascade: optional CascadeStage, trained along with the classifier, that classifies
+        all glyphs before it. Only the glyphs it isn't confident about are given to the classifier
+        """
         self.segmenter = get_instance_from(segmenter, SEGMENTERS, "contour")
         self.extractor = get_instance_from(extractor, EXTRACTORS, "simple")
         self.classifier = get_instance_from(classifier, CLASSIFIERS, "knn")
         self.grounder = get_instance_from(grounder, GROUNDERS, "text")
+        self.projection = get_instance_from(projection, PROJECTIONS, None)
+        self.feature_cache = feature_cache
+        self.cascade = cascade
+        self.lean = lean
+        self.segmenter.set_lean(lean)
+        self._stats = None
+        # blocks of the unprojected (features, classes), or None if they're unknown (a projection given fitted)
+        self._projection_samples = None if self.projection is not None and self.projection.is_fitted else []
+        self._projection_stale = False  # whether the projection must be fitted again on _projection_samples
 
-    def train(self, image_file):
-        """feeds the training data to the OCR"""
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # copies (like those of worker processes) don't refit the projection, so they don't get its samples
+        state["_projection_samples"], state["_projection_stale"] = None, False
+        return state
+
+    def enable_stats(self, enabled=True):
+        """
+        starts (or stops) recording statistics of each ocr() stage: the segmenter
+        processors, the feature extraction and the classification
+        """
+        self._stats = {"extractor": new_stats(), "projection": new_stats(), "classifier": new_stats(),
+                       "cascade_extractor": new_stats(), "cascade_classifier": new_stats()} if enabled else None
+        self.segmenter.enable_stats(enabled)
+
+    def reset_stats(self):
+        if self._stats is not None:
+            self.enable_stats()
+
+    def get_stats(self):
+        """returns the recorded statistics as a dict, or None if they're not enabled"""
+        if self._stats is None:
+            return None
+        stats = dict((stage, dict(s)) for stage, s in self._stats.items())
+        stats["segmenter"] = self.segmenter.get_stats()
+        return stats
+
+    def _timed(self, stage, function, *args):
+        """calls function, recording statistics under stage if they are enabled"""
+        if self._stats is None:
+            return function(*args)
+        start = default_timer()
+        result = function(*args)
+        update_stats(self._stats[stage], default_timer() - start, args[-1], result)
+        return result
+
+    def _training_features(self, extractor, image_file):
+        if self.feature_cache is not None:
+            return self.feature_cache.extract(extractor, image_file.image, image_file.ground.segments)
+        return extractor.extract(image_file.image, image_file.ground.segments)
+
+    def _training_samples(self, image_file):
+        """
+        returns the classes of a grounded image, and its (unprojected) features,
+        and its features for the cascade (None if there's no cascade)
+        """
         if not isinstance(image_file, Image):
             image_file = open_image(image_file)
         if not image_file.is_grounded:
             raise Exception("The provided file is not grounded")
-        features = self.extractor.extract(image_file.image, image_file.ground.segments)
-        self.classifier.train(features, image_file.ground.classes)
+        features = self._training_features(self.extractor, image_file)
+        cascade_features = None
+        if self.cascade is not None:
+            cascade_features = self._training_features(self.cascade.extractor, image_file)
+        return image_file.ground.classes, features, cascade_features
 
-    def ocr(self, image_file, show_steps=False):
-        """performs ocr used trained classifier"""
+    def _add_training_samples(self, classes, features, cascade_features):
+        if self.projection is not None:
+            if self._projection_samples is not None:
+                self._projection_samples.append(classifiers.Classifier._filter_unclassified(features, classes))
+                if self.projection.is_fitted:
+                    self._projection_stale = True  # until then, the samples are projected as the previous ones
+                else:
+                    self.projection.fit(self._projection_samples[0][0])
+            features = self.projection.project(features)
+        self.classifier.add_samples(features, classes)
+        if self.cascade is not None:
+            self.cascade.classifier.add_samples(cascade_features, classes)
+
+    def train(self, image_file):
+        """
+        feeds the training data to the OCR.
+        Training data of successive calls is accumulated
+        """
+        self._add_training_samples(*self._training_samples(image_file))
+
+    def train_many(self, paths_or_glob, workers=None, chunksize=1, progress=None):
+        """
+        Trains on many grounded images, extracting their features on a pool of worker processes.
+        The samples are added to the classifier at once (and accumulated, as in train).
+        :param paths_or_glob: image paths, directories or glob patterns (see find_grounded_images).
+        Only images with a ground file are used
+        :param workers: number of worker processes (defaults to the number of CPUs). With 1, no pool is used
+        :param chunksize: number of images sent to a worker at a time
+        :param progress: optional function, called as progress(images_done, images_total) after each image
+        :return: the paths of the images trained on
+        """
+        paths = find_grounded_images(paths_or_glob)
+        samples, n = None, 0  # classes, features and cascade features of all images, of which n are filled
+        if workers == 1:
+            pool, results = None, ((i, self._training_samples(p)) for i, p in enumerate(paths))
+        else:
+            pool = multiprocessing.Pool(workers, initializer=_init_batch_worker, initargs=(self._training_copy(),))
+            # in order, so samples are added as by train. Workers still run ahead of the results
+            results = pool.imap(_train_worker, enumerate(paths), chunksize)
+        try:
+            for done, (_, image_samples) in enumerate(results, 1):
+                count = len(image_samples[0])
+                if samples is None:
+                    samples = [None] * len(image_samples)
+                samples = [None if s is None else _with_capacity(all_samples, s, n + count)
+                           for all_samples, s in zip(samples, image_samples)]
+                for all_samples, s in zip(samples, image_samples):
+                    if s is not None:
+                        all_samples[n:n + count] = s
+                n += count
+                if progress is not None:
+                    progress(done, len(paths))
+        finally:
+            if pool is not None:
+                pool.terminate()
+        if samples is not None:
+            self._add_training_samples(*[None if s is None else s[:n] for s in samples])
+        return paths
+
+    def _training_copy(self):
+        """returns a OCR that extracts training samples as this one does, without its (accumulated) samples"""
+        cascade = None
+        if self.cascade is not None:
+            cascade = CascadeStage(self.cascade.extractor, max_distance=self.cascade.max_distance)
+        return OCR(self.segmenter, self.extractor, lean=self.lean, feature_cache=self.feature_cache, cascade=cascade)
+
+    def _thread_copy(self, share_classifier=True):
+        """
+        returns a lean OCR for another thread. Segmenters and extractors keep state between calls,
+        so it has its own; the (fitted) projection is shared. With share_classifier, so are the
+        classifiers and their samples (which must be fitted beforehand, so that threads don't fit
+        them concurrently). Otherwise, the copy has no cascade, and only segments and extracts
+        """
+        cascade = None
+        if share_classifier and self.cascade is not None:
+            cascade = CascadeStage(copy.deepcopy(self.cascade.extractor), self.cascade.classifier,
+                                   max_distance=self.cascade.max_distance)
+        return OCR(copy.deepcopy(self.segmenter), copy.deepcopy(self.extractor),
+                   self.classifier if share_classifier else None, lean=True, projection=self.projection,
+                   cascade=cascade)
+
+    def _segment(self, image_file, show_steps=False):
+        """returns a ImageContext of the image, and its segments"""
         if not isinstance(image_file, Image):
             image_file = open_image(image_file)
-        segments = self.segmenter.process(image_file.image)
+        # derived images (grayscale, ...) are computed once, and shared by the stages that accept the context.
+        # The segmenter's are derived from the blurred image, though, if it blurs (see ImageContext)
+        context = ImageContext(image_file.image)
         if show_steps:
-            self.segmenter.display()
-        features = self.extractor.extract(image_file.image, segments)
-        classes = self.classifier.classify(features)
+            self.segmenter.set_lean(False)  # display needs the intermediate results
+            try:
+                segments = self.segmenter.process(context)
+                self.segmenter.display()
+            finally:
+                self.segmenter.set_lean(self.lean)
+                if self.lean:
+                    self.segmenter._release()
+        else:
+            segments = self.segmenter.process(context)
+        return context, segments
+
+    def _update_projection(self):
+        """fits the projection again on all the training samples, and projects them again, if it's stale"""
+        if not self._projection_stale:
+            return
+        features = numpy.concatenate([f for f, _ in self._projection_samples])
+        classes = numpy.concatenate([c for _, c in self._projection_samples])
+        self._projection_samples = [(features, classes)]
+        self.projection.fit(features)
+        self.classifier.train(self.projection.project(features), classes)
+        self._projection_stale = False
+
+    def fit_projection(self):
+        """
+        fits the projection on the training samples (if they changed since it was last fitted), and
+        fixes it: the unprojected samples are released, and those of further train calls are only
+        projected. So a trained OCR only keeps the projected samples
+        """
+        self._update_projection()
+        self._projection_samples = None
+
+    def _features(self, context, segments):
+        self._update_projection()
+        image = context if self.extractor.ACCEPTS_CONTEXT else context.image
+        features = self._timed("extractor", self.extractor.extract, image, segments)
+        if self.projection is not None:
+            features = self._timed("projection", self.projection.project, features)
+        return features
+
+    def extract(self, image_file, show_steps=False):
+        """segments the image and returns (segments, features), the features as given to the classifier"""
+        context, segments = self._segment(image_file, show_steps)
+        return segments, self._features(context, segments)
+
+    def _cascade_classify(self, context, segments):
+        """classifies with the cascade, then with the classifier the glyphs the cascade isn't confident about"""
+        image = context if self.cascade.extractor.ACCEPTS_CONTEXT else context.image
+        features = self._timed("cascade_extractor", self.cascade.extractor.extract, image, segments)
+        classes, confident = self._timed("cascade_classifier", self.cascade.classify, features)
+        uncertain = numpy.flatnonzero(~confident)
+        if len(uncertain):
+            features = self._features(context, segments[uncertain])
+            classes[uncertain] = self._timed("classifier", self.classifier.classify, features)
+        return classes
+
+    def _classify(self, context, segments):
+        if self.cascade is None:
+            return self._timed("classifier", self.classifier.classify, self._features(context, segments))
+        return self._cascade_classify(context, segments)
+
+    def ocr(self, image_file, show_steps=False, rois=None, roi_workers=1):
+        """
+        performs ocr used trained classifier
+        :param rois: optional list of (x, y, width, height) regions of interest. If given, only
+        they are processed (as views of the image, not copies), and a list with the result
+        of each one is returned. Their segments are in the coordinates of the whole image
+        :param roi_workers: number of threads segmenting the regions of interest
+        """
+        if rois is not None:
+            return self._ocr_rois(image_file, rois, roi_workers)
+        context, segments = self._segment(image_file, show_steps)
+        classes = self._classify(context, segments)
         chars = reconstruct_chars(classes)
         return chars, classes, segments
 
+    def _ocr_rois(self, image_file, rois, workers):
+        if not isinstance(image_file, Image):
+            image_file = open_image(image_file)
+        image = image_file.image
+        views = [image[y:y + h, x:x + w] for x, y, w, h in rois]
+        if workers > 1:  # opencv releases the GIL, so threads segment in parallel
+            pool = ThreadPool(workers, initializer=_init_roi_worker, initargs=(self,))
+            try:
+                segmented = pool.map(_roi_segment, views)
+            finally:
+                pool.close()
+        else:
+            segmented = [self._segment(Image(view)) for view in views]
+        results = []
+        for (x, y, _, _), (context, segments) in zip(rois, segmented):
+            classes = self._classify(context, segments)
+            segments = segments + numpy.array([x, y, 0, 0], dtype=SEGMENT_DATATYPE)
+            results.append((reconstruct_chars(classes), classes, segments))
+        return results
+
+    def save(self, path):
+        """
+        Saves the trained OCR to a directory, so it can be restored with OCR.load
+        without training again. The segmenter, extractors, classifiers and projection
+        must be registered in SEGMENTERS, EXTRACTORS, CLASSIFIERS and PROJECTIONS.
+        :param path: path of the directory to create (or overwrite)
+        """
+        self._update_projection()
+        features, classes = self.classifier.get_samples()
+        if features is None:
+            raise Exception("Can't save an OCR that was not trained")
+        model = {
+            "version": MODEL_FORMAT_VERSION,
+            "segmenter": [get_key_of(self.segmenter, SEGMENTERS), self.segmenter.get_parameters()],
+            "extractor": [get_key_of(self.extractor, EXTRACTORS), self.extractor.get_parameters()],
+            "classifier": [get_key_of(self.classifier, CLASSIFIERS), self.classifier.get_parameters()],
+        }
+        if self.projection is not None:
+            model["projection"] = [get_key_of(self.projection, PROJECTIONS), self.projection.get_parameters()]
+        if self.cascade is not None:
+            cascade_features, cascade_classes = self.cascade.classifier.get_samples()
+            model["cascade"] = {
+                "parameters": self.cascade.get_parameters(),
+                "extractor": [get_key_of(self.cascade.extractor, EXTRACTORS), self.cascade.extractor.get_parameters()],
+                "classifier": [get_key_of(self.cascade.classifier, CLASSIFIERS),
+                               self.cascade.classifier.get_parameters()],
+            }
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        if self.projection is not None:
+            numpy.savez(os.path.join(path, MODEL_PROJECTION_FILE), **self.projection.get_arrays())
+        numpy.save(os.path.join(path, MODEL_FEATURES_FILE), features)
+        numpy.save(os.path.join(path, MODEL_CLASSES_FILE), numpy.asarray(classes, dtype=CLASS_DATATYPE))
+        if self.cascade is not None:
+            numpy.save(os.path.join(path, MODEL_CASCADE_FEATURES_FILE), cascade_features)
+            numpy.save(os.path.join(path, MODEL_CASCADE_CLASSES_FILE),
+                       numpy.asarray(cascade_classes, dtype=CLASS_DATATYPE))
+        with io.open(os.path.join(path, MODEL_FILE), "w", encoding="utf-8") as f:
+            f.write(text_type(json.dumps(model, sort_keys=True)))
+
+    @classmethod
+    def load(cls, path, grounder=None):
+        """
+        Creates a trained OCR from a directory written by OCR.save.
+        The feature matrices are memory-mapped, but only the "bruteforce" classifier
+        reads them in place, so that processes loading the same model share their pages.
+        The others build their model from a private copy: opencv's KNearest ("knn") copies
+        the samples when trained, and "kdtree" reorders them into its tree.
+        """
+        with io.open(os.path.join(path, MODEL_FILE), encoding="utf-8") as f:
+            model = json.load(f)
+        if model.get("version") not in MODEL_FORMAT_SUPPORTED_VERSIONS:
+            raise ValueError("Unsupported model version {0} in {1}".format(model.get("version"), path))
+        (sk, sp), (ek, ep), (ck, cp) = model["segmenter"], model["extractor"], model["classifier"]
+        projection = None
+        if "projection" in model:
+            pk, pp = model["projection"]
+            projection = PROJECTIONS[pk](**pp)
+            with numpy.load(os.path.join(path, MODEL_PROJECTION_FILE)) as arrays:
+                projection.set_arrays(**dict(arrays.items()))
+        cascade = None
+        if "cascade" in model:
+            (cek, cep), (cck, ccp) = model["cascade"]["extractor"], model["cascade"]["classifier"]
+            cascade = CascadeStage(EXTRACTORS[cek](**cep), CLASSIFIERS[cck](**ccp), **model["cascade"]["parameters"])
+            cascade.classifier.train(numpy.load(os.path.join(path, MODEL_CASCADE_FEATURES_FILE), mmap_mode="r"),
+                                     numpy.load(os.path.join(path, MODEL_CASCADE_CLASSES_FILE)))
+        ocr = cls(SEGMENTERS[sk](**sp), EXTRACTORS[ek](**ep), CLASSIFIERS[ck](**cp), grounder,
+                  projection=projection, cascade=cascade)
+        features = numpy.load(os.path.join(path, MODEL_FEATURES_FILE), mmap_mode="r")
+        classes = numpy.load(os.path.join(path, MODEL_CLASSES_FILE))
+        ocr.classifier.train(features, classes)
+        return ocr
+
+    def ocr_batch(self, image_files, workers=None, chunksize=1, ordered=True):
+        """
+        Performs ocr on many images, using a pool of worker processes.
+        Each worker gets a copy of this (trained) OCR once, when it starts.
+        :param image_files: iterable of image paths or Image objects
+        :param workers: number of worker processes (defaults to the number of CPUs)
+        :param chunksize: number of images sent to a worker at a time
+        :param ordered: if True, results are yielded in the order of image_files, as
+        (chars, classes, segments). Otherwise they're yielded as they finish, as
+        (index, (chars, classes, segments)), where index is the position in image_files
+        """
+        self._update_projection()  # once, instead of on each worker
+        pool = multiprocessing.Pool(workers, initializer=_init_batch_worker, initargs=(self,))
+        try:
+            imap = pool.imap if ordered else pool.imap_unordered
+            for i, result in imap(_batch_worker, enumerate(image_files), chunksize):
+                yield result if ordered else (i, result)
+        finally:
+            pool.terminate()
+
     def ground(self, image_file, text=None):
         """
         Ground an image file for use in the OCR object.
@@ -1,5 +1,6 @@
-from .numpy_utils import OverflowPreventer
-from .processor import DisplayingProcessor
+from .processor import DisplayingProcessor, ProcessingContext, unwrap_context
+import collections
+import threading
 import numpy
 import cv2
 
@@ -7,8 +8,8 @@ import cv2
 class ImageProcessor(DisplayingProcessor):
     def display(self, display_before=True):
         if display_before:
-            show_image_and_wait_for_key(self._input, "before " + self.__class__.__name__)
-        show_image_and_wait_for_key(self._output, "after " + self.__class__.__name__)
+            show_image_and_wait_for_key(unwrap_context(self._input), "before " + self.__class__.__name__)
+        show_image_and_wait_for_key(unwrap_context(self._output), "after " + self.__class__.__name__)
 
     def _process(self, image):
         return self._image_processing(image)
@@ -17,6 +18,29 @@ class ImageProcessor(DisplayingProcessor):
         raise NotImplementedError(str(self.__class__))
 
 
+MAX_LOOKUP_TABLES = 64  # number of lookup tables cached (least recently used are discarded)
+_lookup_tables = collections.OrderedDict()  # saturating lookup tables, by (kind, parameters), least recently used first
+_lookup_tables_lock = threading.Lock()
+
+
+def _lookup_table(key, function):
+    """returns the cached 256-entry uint8 table of function(numpy.arange(256)), clipped to [0, 255]"""
+    with _lookup_tables_lock:
+        table = _lookup_tables.pop(key, None)
+        if table is None:
+            table = numpy.clip(function(numpy.arange(256, dtype=numpy.float64)), 0, 255).astype(numpy.uint8)
+            if len(_lookup_tables) >= MAX_LOOKUP_TABLES:
+                _lookup_tables.popitem(last=False)
+        _lookup_tables[key] = table
+        return table
+
+
+def brightness_table(brightness):
+    """returns the lookup table of BrightnessProcessor, for a brightness in [-1, 1]"""
+    offset = int(brightness * 256)
+    return _lookup_table(("brightness", offset), lambda x: x + offset)
+
+
 class BrightnessProcessor(ImageProcessor):
     """
     changes image brightness.
@@ -30,10 +54,7 @@ class BrightnessProcessor(ImageProcessor):
         b = self.brightness
         assert image.dtype == numpy.uint8
         assert -1 <= b <= 1
-        image = image.copy()
-        with OverflowPreventer(image) as img:
-            img += int(b * 256)
-        return image
+        return cv2.LUT(image, brightness_table(b))
 
 
 class ContrastProcessor(ImageProcessor):
@@ -42,32 +63,183 @@ class ContrastProcessor(ImageProcessor):
 
     def _image_processing(self, image):
         assert image.dtype == numpy.uint8
-        image = image.copy()
-        s, c = self.scale, self.center
-        c = int(c * 256)
-        with OverflowPreventer(image) as img:
-            if s <= 1:
-                img *= s
-                img += int(c * (1 - s))
-            else:
-                img -= c * (1 - 1 / s)
-                img *= s
-        return image
+        s, c = self.scale, int(self.center * 256)
+        return cv2.LUT(image, _lookup_table(("contrast", s, c), lambda x: _contrast(x, s, c)))
+
+
+def _contrast(x, s, c):
+    """scales levels x by s around c, saturating (and truncating) after each step"""
+    if s <= 1:
+        return numpy.floor(x * s) + int(c * (1 - s))
+    return numpy.floor(numpy.clip(numpy.floor(numpy.clip(x - c * (1 - 1 / s), 0, 255)) * s, 0, 255))
+
+
+SHARPNESS_SMOOTH_KERNEL = numpy.array([[1, 1, 1], [1, 5, 1], [1, 1, 1]], dtype=numpy.float32) / 13  # as PIL's SMOOTH
+
+
+def _blend_table(table, degenerate, factor):
+    """applies degenerate + factor * (table - degenerate) to a lookup table, truncating like PIL's blend"""
+    return numpy.clip(numpy.floor(degenerate + factor * (table - degenerate)), 0, 255)
+
+
+class EnhanceProcessor(ImageProcessor):
+    """
+    Enhances a BGR image like PIL's ImageEnhance (Color, Brightness, Contrast and Sharpness,
+    where factors of 1.0 make no changes), optionally inverting it. The brightness, contrast
+    and inversion are fused into one lookup table, so each of color, table and sharpness
+    takes at most one pass over the image. The input image is not modified.
+    A few pixels may differ from PIL's results by a grey level or two, from rounding.
+    """
+    PARAMETERS = ImageProcessor.PARAMETERS + {"color": 1.0, "brightness": 1.0, "contrast": 1.0, "sharpness": 1.0,
+                                              "invert": False}
+
+    def _contrast_mean(self, image, table):
+        """the mean grayscale level of the image after the table is applied, as used by PIL's Contrast"""
+        if numpy.array_equal(table, numpy.arange(256)):
+            b, g, r = cv2.mean(image)[:3]
+        else:
+            b, g, r = [numpy.dot(cv2.calcHist([image], [c], None, [256], [0, 256])[:, 0], table) / image[..., c].size
+                       for c in range(3)]
+        return int(0.299 * r + 0.587 * g + 0.114 * b + 0.5)
+
+    def _image_processing(self, image):
+        assert image.dtype == numpy.uint8 and image.ndim == 3
+        output = None  # written to in place, once created
+        if self.color != 1.0:
+            gray = cv2.cvtColor(cv2.cvtColor(image, cv2.COLOR_BGR2GRAY), cv2.COLOR_GRAY2BGR)
+            output = cv2.addWeighted(image, self.color, gray, 1.0 - self.color, -0.499)  # truncates, as PIL
+        table = numpy.arange(256, dtype=numpy.float64)
+        if self.brightness != 1.0:
+            table = _blend_table(table, 0, self.brightness)
+        if self.contrast != 1.0:
+            mean = self._contrast_mean(image if output is None else output, table)
+            table = _blend_table(table, mean, self.contrast)
+        if self.invert:  # PIL inverts after sharpening. Both commute, up to rounding
+            table = 255 - table
+        if self.brightness != 1.0 or self.contrast != 1.0 or self.invert:
+            table = table.astype(numpy.uint8)
+            output = cv2.LUT(image, table) if output is None else cv2.LUT(output, table, dst=output)
+        if self.sharpness != 1.0:
+            source = image if output is None else output
+            kernel = (1.0 - self.sharpness) * SHARPNESS_SMOOTH_KERNEL
+            kernel[1, 1] += self.sharpness
+            sharpened = cv2.filter2D(source, -1, kernel)
+            # like PIL, the border pixels are left unchanged
+            sharpened[[0, -1]], sharpened[:, [0, -1]] = source[[0, -1]], source[:, [0, -1]]
+            output = sharpened
+        return image if output is None else output
 
 
 class BlurProcessor(ImageProcessor):
     """changes image contrast. a scale of 1 will make no changes"""
     PARAMETERS = ImageProcessor.PARAMETERS + {"blur_x": 0, "blur_y": 0}
+    ACCEPTS_CONTEXT = True
+
+    def _process(self, image):
+        if isinstance(image, ImageContext):
+            return image.blurred(self.blur_x, self.blur_y)
+        return self._image_processing(image)
 
     def _image_processing(self, image):
         assert image.dtype == numpy.uint8
-        image = image.copy()
-        x, y = self.blur_x, self.blur_y
-        if x or y:
-            x += (x + 1) % 2  # opencv needs a
-            y += (y + 1) % 2  # odd number...
-            image = cv2.GaussianBlur(image, (x, y), 0)
+        return blur_image(image, self.blur_x, self.blur_y)
+
+
+class DownscaleProcessor(ImageProcessor):
+    """
+    downscales the image by a power of two (with area interpolation): halving it as many times
+    as glyphs of glyph_height stay at least working_glyph_height tall, and then as many more times
+    as needed to fit the image in max_working_size. The resulting scale factor is stored
+    as the scale attribute. A glyph_height or max_working_size of 0 means it's unknown.
+    """
+    PARAMETERS = ImageProcessor.PARAMETERS + {"glyph_height": 0, "working_glyph_height": 20, "max_working_size": 0}
+    ACCEPTS_CONTEXT = True  # passed on as is, if the image isn't downscaled
+    scale = 1
+
+    def _levels(self, height, width):
+        levels = 0
+        if self.glyph_height:
+            while self.glyph_height // 2 ** (levels + 1) >= self.working_glyph_height:
+                levels += 1
+        if self.max_working_size:
+            while -(-max(height, width) // 2 ** levels) > self.max_working_size:
+                levels += 1
+        return levels
+
+    def _process(self, image):
+        data = unwrap_context(image)
+        levels = self._levels(*data.shape[:2])
+        self.scale = 2 ** levels
+        if not levels:
+            return image
+        return self._image_processing(data, levels)
+
+    def _image_processing(self, image, levels=1):
+        scale = 2 ** levels
+        height, width = image.shape[:2]
+        size = (-(-width // scale), -(-height // scale))
+        return cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+
+
+class ImageContext(ProcessingContext):
+    """
+    A image, with lazily computed (and cached) views derived from it, shared by
+    the pipeline stages that use them during a single OCR call. The views must not be modified.
+    A blurred image has its own context (see blurred), so with blur the grayscale conversion
+    still runs twice: on the blurred image, for the segmenter, and on the original, for the
+    extractor. Blurring the original's grayscale instead would be cheaper, but it rounds
+    differently, changing the binarization (and so the segments) of some images.
+    """
+    @property
+    def image(self):
+        return self.data
+
+    @property
+    def gray(self):
+        return self.cached("gray", to_gray, self.data)
+
+    @property
+    def background_color(self):
+        """background_color of the grayscale image"""
+        return self.cached("background_color", background_color, self.gray)
+
+    def blurred(self, blur_x, blur_y):
+        """returns a ImageContext of the blurred image (see blur_image). Without blur, that's this one"""
+        if not (blur_x or blur_y):
+            return self
+        return self.cached(("blurred", blur_x, blur_y), _blurred_context, self.data, blur_x, blur_y)
+
+    def binarized(self, block_size, c):
+        """the gaussian adaptive threshold of the grayscale image"""
+        return self.cached(("binarized", block_size, c), cv2.adaptiveThreshold, self.gray, 255,
+                           cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, block_size, c)
+
+
+def _blurred_context(image, blur_x, blur_y):
+    return ImageContext(blur_image(image, blur_x, blur_y))
+
+
+def image_context(image):
+    """returns a ImageContext of image, or image itself if it already is one"""
+    return image if isinstance(image, ImageContext) else ImageContext(image)
+
+
+def to_gray(image):
+    """converts a BGR image to grayscale. Grayscale images are returned unchanged"""
+    if image.ndim == 2:
         return image
+    return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+
+def blur_image(image, blur_x, blur_y):
+    """returns a gaussian blurred copy of the image. The kernel size is rounded up to a odd number"""
+    image = image.copy()
+    x, y = blur_x, blur_y
+    if x or y:
+        x += (x + 1) % 2  # opencv needs a
+        y += (y + 1) % 2  # odd number...
+        image = cv2.GaussianBlur(image, (x, y), 0)
+    return image
 
 
 def ask_for_key(return_arrow_keys=True):
@@ -122,10 +294,13 @@ def draw_classes(image, segments, classes):
         cv2.putText(image, c, (x, y), 0, 0.5, (128, 128, 128))
 
 
+_OPENCV_VERSION = int(cv2.__version__.split(".")[0])
+
+
 def get_opencv_version():
     """
-    Return the OpenCV version by checking cv2.__version__
+    Return the OpenCV (major) version, from cv2.__version__
     :return: int
     """
-    return int(cv2.__version__.split(".")[0])
+    return _OPENCV_VERSION
 
@@ -1,3 +1,6 @@
+from timeit import default_timer
+
+
 def _same_type(a, b):
     type_correct = False
     if type(a) == type(b):
@@ -22,7 +25,11 @@ def _broadcast(src_processor, src_atr_name, dest_processors, dest_atr_name, tran
         setattr(d, dest_atr_name, value)
 
 
-def create_broadcast(src_atr_name, dest_processors, dest_atr_name=None, transform_function=lambda x: x):
+def _identity(x):
+    return x
+
+
+def create_broadcast(src_atr_name, dest_processors, dest_atr_name=None, transform_function=_identity):
     """
     This method creates a function, intended to be called as a
     Processor posthook, that copies some of the processor's attributes
@@ -37,6 +44,50 @@ def create_broadcast(src_atr_name, dest_processors, dest_atr_name=None, transfor
                    transform_function=transform_function)
 
 
+class ProcessingContext(object):
+    """
+    Wraps the data given to process(), caching values derived from it,
+    so they are computed at most once even if several processors need them.
+    Processors that don't set ACCEPTS_CONTEXT are given the wrapped data instead.
+    """
+    def __init__(self, data):
+        self.data = data
+        self._cache = {}
+
+    def cached(self, key, function, *args):
+        """returns function(*args), computing it only on the first call with this key"""
+        try:
+            return self._cache[key]
+        except KeyError:
+            value = self._cache[key] = function(*args)
+            return value
+
+
+def unwrap_context(data):
+    """returns the data wrapped by a ProcessingContext, or data itself if it isn't one"""
+    return data.data if isinstance(data, ProcessingContext) else data
+
+
+def new_stats():
+    """returns empty statistics, as recorded by Processor.process when stats are enabled"""
+    return {"calls": 0, "seconds": 0.0, "input_size": 0, "output_size": 0}
+
+
+def _size(data):
+    """the number of elements (segments, image rows, ...) in data, for statistics"""
+    try:
+        return len(unwrap_context(data))
+    except TypeError:
+        return 0
+
+
+def update_stats(stats, seconds, input_data, output_data):
+    stats["calls"] += 1
+    stats["seconds"] += seconds
+    stats["input_size"] += _size(input_data)
+    stats["output_size"] += _size(output_data)
+
+
 class Parameters(dict):
     def __add__(self, other):
         d3 = Parameters()
@@ -54,6 +105,10 @@ class Processor(object):
     """
 
     PARAMETERS = Parameters()
+    DEBUG_ATTRIBUTES = ("_input", "_output")  # kept only for debugging (display), unless lean
+    ACCEPTS_CONTEXT = False  # whether process() takes a ProcessingContext, instead of the data it wraps
+    _stats = None  # statistics of process() calls, when enabled
+    _lean = False
 
     def __init__(self, **args):
         """sets default parameters"""
@@ -65,9 +120,8 @@ class Processor(object):
 
     def get_parameters(self):
         """returns a dictionary with the processor's stored parameters"""
-        parameter_names = self.PARAMETERS.keys()
-        # TODO: Unresolved reference for processor
-        parameter_values = [getattr(processor, n) for n in parameter_names]
+        parameter_names = list(self.PARAMETERS.keys())
+        parameter_values = [getattr(self, n) for n in parameter_names]
         return dict(zip(parameter_names, parameter_values))
 
     def set_parameters(self, **args):
@@ -93,14 +147,52 @@ class Processor(object):
     def add_poshook(self, poshook_function):
         self._poshooks.append(poshook_function)
 
+    def enable_stats(self, enabled=True):
+        """starts (or stops) recording the calls, time and input/output sizes of process()"""
+        self._stats = new_stats() if enabled else None
+
+    def reset_stats(self):
+        if self._stats is not None:
+            self._stats = new_stats()
+
+    def get_stats(self):
+        """returns the recorded statistics as a dict, or None if they're not enabled"""
+        if self._stats is None:
+            return None
+        stats = dict(self._stats)
+        stats["name"] = self.__class__.__name__
+        return stats
+
+    def set_lean(self, lean=True):
+        """
+        On lean processors, the DEBUG_ATTRIBUTES (inputs, outputs, images...)
+        are discarded after each process() call, instead of being kept for display()
+        """
+        self._lean = lean
+
+    def _release(self):
+        for name in self.DEBUG_ATTRIBUTES:
+            self.__dict__.pop(name, None)
+
     def process(self, arguments):
+        if not self.ACCEPTS_CONTEXT:
+            arguments = unwrap_context(arguments)
         self._input = arguments
-        for prehook in self._prehooks:
-            prehook(self)
-        output = self._process(arguments)
-        self._output = output
-        for poshook in self._poshooks:
-            poshook(self)
+        try:
+            for prehook in self._prehooks:
+                prehook(self)
+            if self._stats is None:
+                output = self._process(arguments)
+            else:
+                start = default_timer()
+                output = self._process(arguments)
+                update_stats(self._stats, default_timer() - start, arguments, output)
+            self._output = output
+            for poshook in self._poshooks:
+                poshook(self)
+        finally:
+            if self._lean:
+                self._release()
         return output
 
 
@@ -116,6 +208,7 @@ class DisplayingProcessor(Processor):
 
 class ProcessorStack(Processor):
     """a stack of processors. Each processor's output is fed to the next"""
+    ACCEPTS_CONTEXT = True  # passed on; each wrapped processor unwraps it if needed
 
     def __init__(self, processor_instances=[], **args):
         self.set_processor_stack(processor_instances)
@@ -144,6 +237,36 @@ class ProcessorStack(Processor):
             not_given = not_given.union(ng)
         return not_used, not_given
 
+    def set_lean(self, lean=True):
+        """sets the stack and, recursively, all wrapped processors as lean"""
+        Processor.set_lean(self, lean)
+        for p in self.processors:
+            p.set_lean(lean)
+
+    def _release(self):
+        # wrapped processors may hold broadcast data even if they didn't run (after a exception)
+        Processor._release(self)
+        for p in self.processors:
+            p._release()
+
+    def enable_stats(self, enabled=True):
+        """enables statistics on the stack and, recursively, on all wrapped processors"""
+        Processor.enable_stats(self, enabled)
+        for p in self.processors:
+            p.enable_stats(enabled)
+
+    def reset_stats(self):
+        Processor.reset_stats(self)
+        for p in self.processors:
+            p.reset_stats()
+
+    def get_stats(self):
+        """returns the stack statistics, with the ones of each wrapped processor in stats["processors"]"""
+        stats = Processor.get_stats(self)
+        if stats is not None:
+            stats["processors"] = [p.get_stats() for p in self.processors]
+        return stats
+
     def _process(self, arguments):
         for p in self.processors:
             arguments = p.process(arguments)
@@ -1,5 +1,7 @@
-from .opencv_utils import show_image_and_wait_for_key, draw_segments, BlurProcessor, get_opencv_version
-from .processor import DisplayingProcessor, DisplayingProcessorStack, create_broadcast
+from .opencv_utils import show_image_and_wait_for_key, draw_segments, BlurProcessor, get_opencv_version, blur_image, \
+    image_context, DownscaleProcessor
+from .processor import Processor, DisplayingProcessor, DisplayingProcessorStack, create_broadcast, unwrap_context
+from multiprocessing.pool import ThreadPool
 from .segmentation_aux import SegmentOrderer
 from .segmentation_filters import create_default_filter_stack
 import numpy
@@ -32,6 +34,7 @@ def region_from_segment(image, segment):
 
 class RawSegmenter(DisplayingProcessor):
     """A image segmenter. input is image, output is segments"""
+    DEBUG_ATTRIBUTES = DisplayingProcessor.DEBUG_ATTRIBUTES + ("image", "segments")
 
     def _segment(self, image):
         """segments an opencv image for OCR. returns list of 4-element tuples (x,y,width, height)."""
@@ -40,7 +43,7 @@ class RawSegmenter(DisplayingProcessor):
 
     def _process(self, image):
         segments = self._segment(image)
-        self.image, self.segments = image, segments
+        self.image, self.segments = unwrap_context(image), segments
         return segments
 
 
@@ -50,16 +53,24 @@ class FullSegmenter(DisplayingProcessorStack):
 
 class RawContourSegmenter(RawSegmenter):
     PARAMETERS = RawSegmenter.PARAMETERS + {"block_size": 11, "c": 10}
+    DEBUG_ATTRIBUTES = RawSegmenter.DEBUG_ATTRIBUTES + ("contours", "hierarchy")
+    ACCEPTS_CONTEXT = True
 
-    def _segment(self, image):
-        self.image = image
-        image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        image = cv2.adaptiveThreshold(image, maxValue=255, adaptiveMethod=cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
-                                      thresholdType=cv2.THRESH_BINARY, blockSize=self.block_size, C=self.c)
+    def _find_contours(self, image):
+        """thresholds a BGR image (or ImageContext) and returns its contours and their hierarchy"""
+        image = image_context(image).binarized(self.block_size, self.c)
         if get_opencv_version() == 3:
-            _, contours, hierarchy = cv2.findContours(image, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
+            # findContours modified its input before opencv 3.2, and the binarized image is shared
+            _, contours, hierarchy = cv2.findContours(image.copy(), cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
+        elif get_opencv_version() == 2:
+            contours, hierarchy = cv2.findContours(image.copy(), cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
         else:
             contours, hierarchy = cv2.findContours(image, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
+        return contours, hierarchy
+
+    def _segment(self, image):
+        self.image = unwrap_context(image)
+        contours, hierarchy = self._find_contours(image)
         segments = segments_to_numpy([cv2.boundingRect(c) for c in contours])
         self.contours, self.hierarchy = contours, hierarchy  # store, may be needed for debugging
         return segments
@@ -76,9 +87,167 @@ class RawContourSegmenter(RawSegmenter):
         show_image_and_wait_for_key(copy, "image after segmentation by " + self.__class__.__name__)
 
 
+class SegmentUpscaler(Processor):
+    """
+    maps segments found on a downscaled image (see DownscaleProcessor) back to the
+    coordinates of the original image. The scale attribute is set by the downscaling processor.
+    Segments touching the right or bottom border may extend up to scale - 1 pixels past it
+    """
+    scale = 1
+
+    def _process(self, segments):
+        if self.scale == 1:
+            return segments
+        return (segments.astype(numpy.int64) * self.scale).astype(SEGMENT_DATATYPE)
+
+
+def _tile_ranges(length, tile_size, overlap):
+    """returns the starts and ends of each tile along a axis, including the overlap"""
+    starts = numpy.arange(0, length, tile_size)
+    ends = numpy.minimum(starts + tile_size, length)
+    return numpy.maximum(starts - overlap, 0), numpy.minimum(ends + overlap, length)
+
+
+def _tiles_containing(starts, ends, length, lo, hi, margin):
+    """
+    returns a boolean matrix telling, for each (lo, hi) interval (rows), if it's
+    at least margin away from the seams of each tile (columns). Image borders aren't seams.
+    """
+    lo, hi = lo[:, numpy.newaxis], hi[:, numpy.newaxis]
+    after_start = (starts == 0) | (lo >= starts + margin)
+    before_end = (ends == length) | (hi <= ends - margin)
+    return after_start & before_end
+
+
+def _contained_in_any(segments, containers, block_size=256):
+    """returns a boolean array telling if each segment is inside (or equal to) any of the containers"""
+    result = numpy.zeros(len(segments), dtype=bool)
+    if not len(segments) or not len(containers):
+        return result
+    containers = containers[numpy.argsort(containers[:, 0], kind="mergesort")]
+    cx1, cy1 = containers[:, 0], containers[:, 1]
+    cx2, cy2 = cx1 + containers[:, 2], cy1 + containers[:, 3]
+    max_width = containers[:, 2].max()
+    order = numpy.argsort(segments[:, 0], kind="mergesort")
+    for i in range(0, len(order), block_size):
+        block = order[i:i + block_size]
+        x1, y1 = segments[block, 0:1], segments[block, 1:2]
+        x2, y2 = x1 + segments[block, 2:3], y1 + segments[block, 3:4]
+        # only containers starting at most max_width before the block can contain it
+        lo = numpy.searchsorted(cx1, x1.min() - max_width)
+        hi = numpy.searchsorted(cx1, x1.max(), side="right")
+        c = slice(lo, hi)
+        inside = (x1 >= cx1[c]) & (y1 >= cy1[c]) & (x2 <= cx2[c]) & (y2 <= cy2[c])
+        result[block] = numpy.any(inside, axis=1)
+    return result
+
+
+def merge_overlapping_segments(segments):
+    """merges segments that overlap or touch into their bounding segment, until none do"""
+    boxes = [[int(x), int(y), int(x + w), int(y + h)] for x, y, w, h in segments]
+    merged = True
+    while merged:
+        merged = False
+        result = []
+        for b in boxes:
+            for r in result:
+                if b[0] <= r[2] and r[0] <= b[2] and b[1] <= r[3] and r[1] <= b[3]:
+                    r[:] = min(b[0], r[0]), min(b[1], r[1]), max(b[2], r[2]), max(b[3], r[3])
+                    merged = True
+                    break
+            else:
+                result.append(b)
+        boxes = result
+    return numpy.array([(x0, y0, x1 - x0, y1 - y0) for x0, y0, x1, y1 in boxes], dtype=numpy.int64).reshape(-1, 4)
+
+
+class TiledRawContourSegmenter(RawContourSegmenter):
+    """
+    Same as BlurProcessor followed by RawContourSegmenter, but working on
+    overlapping tiles, so memory use depends on the tile size instead of the image size.
+    Segments that fit inside a tile's overlap (tile_overlap, minus the blur and
+    threshold neighbourhood) are the same as the ones found on the whole image.
+    Larger ones, which are cut by tile seams, are approximated by merging their pieces.
+    """
+    PARAMETERS = RawContourSegmenter.PARAMETERS + BlurProcessor.PARAMETERS + \
+        {"tile_size": 1024, "tile_overlap": 128, "tile_workers": 1}
+    ACCEPTS_CONTEXT = False  # works on tiles, not on views of the whole image
+
+    def _margin(self):
+        """distance to a tile seam under which results differ from the untiled segmentation"""
+        return self.block_size // 2 + max(self.blur_x, self.blur_y) // 2 + 2
+
+    def _segment_tile(self, tile_index):
+        """returns the complete segments this tile owns, and the segments cut by its seams"""
+        (r, c), (ys, ye), (xs, xe), (h, w) = tile_index, self._rows, self._cols, self.image.shape[:2]
+        tile = blur_image(self.image[ys[r]:ye[r], xs[c]:xe[c]], self.blur_x, self.blur_y)
+        contours, _ = self._find_contours(tile)
+        segments = numpy.array([cv2.boundingRect(x) for x in contours], dtype=numpy.int64).reshape(-1, 4)
+        segments[:, 0] += xs[c]
+        segments[:, 1] += ys[r]
+        x1, y1 = segments[:, 0], segments[:, 1]
+        x2, y2 = x1 + segments[:, 2], y1 + segments[:, 3]
+        margin = self._margin()
+        in_cols = _tiles_containing(xs, xe, w, x1, x2, margin)
+        in_rows = _tiles_containing(ys, ye, h, y1, y2, margin)
+        complete = in_cols[:, c] & in_rows[:, r]
+        # a segment complete on several tiles is only kept by the first of them
+        owned = complete & (numpy.argmax(in_cols, axis=1) == c) & (numpy.argmax(in_rows, axis=1) == r)
+        return segments[owned], segments[complete], segments[~complete]
+
+    def _segment(self, image):
+        self.image = image
+        h, w = image.shape[:2]
+        if self.tile_overlap < self._margin():
+            raise ValueError("tile_overlap must be at least {0}".format(self._margin()))
+        self._rows = _tile_ranges(h, self.tile_size, self.tile_overlap)
+        self._cols = _tile_ranges(w, self.tile_size, self.tile_overlap)
+        tiles = [(r, c) for r in range(len(self._rows[0])) for c in range(len(self._cols[0]))]
+        if self.tile_workers > 1:  # opencv releases the GIL, so threads run in parallel
+            pool = ThreadPool(self.tile_workers)
+            try:
+                results = pool.map(self._segment_tile, tiles)
+            finally:
+                pool.close()
+        else:
+            results = list(map(self._segment_tile, tiles))
+        owned = numpy.concatenate([o for o, _, _ in results])
+        complete = numpy.concatenate([c for _, c, _ in results])
+        cut = numpy.concatenate([f for _, _, f in results])
+        # cut segments that are pieces of a segment complete on another tile are discarded
+        cut = cut[~_contained_in_any(cut, complete)]
+        segments = numpy.concatenate([owned, merge_overlapping_segments(cut)])
+        self.contours, self.hierarchy = [], None  # contours are not kept across tiles
+        return segments.astype(SEGMENT_DATATYPE)
+
+
 class ContourSegmenter(FullSegmenter):
     def __init__(self, **args):
         filters = create_default_filter_stack()
         stack = [BlurProcessor(), RawContourSegmenter()] + filters + [SegmentOrderer()]
         FullSegmenter.__init__(self, stack, **args)
-        stack[0].add_prehook(create_broadcast("_input", filters, "image"))
+        stack[0].add_prehook(create_broadcast("_input", filters, "image", unwrap_context))
+
+
+class PyramidContourSegmenter(FullSegmenter):
+    """
+    ContourSegmenter, segmenting a downscaled copy of the image (see DownscaleProcessor),
+    so that the filters' size limits apply to the glyphs at the working scale.
+    The segments are returned in the coordinates of the original image
+    """
+    def __init__(self, **args):
+        filters = create_default_filter_stack()
+        pyramid, upscaler = DownscaleProcessor(), SegmentUpscaler()
+        stack = [pyramid, BlurProcessor(), RawContourSegmenter()] + filters + [SegmentOrderer(), upscaler]
+        FullSegmenter.__init__(self, stack, **args)
+        pyramid.add_poshook(create_broadcast("scale", upscaler))
+        stack[1].add_prehook(create_broadcast("_input", filters, "image", unwrap_context))
+
+
+class TiledContourSegmenter(FullSegmenter):
+    """ContourSegmenter, segmenting the image in tiles. See TiledRawContourSegmenter"""
+    def __init__(self, **args):
+        filters = create_default_filter_stack()
+        stack = [TiledRawContourSegmenter()] + filters + [SegmentOrderer()]
+        FullSegmenter.__init__(self, stack, **args)
+        stack[0].add_prehook(create_broadcast("_input", filters, "image", unwrap_context))
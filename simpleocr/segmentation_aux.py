@@ -14,14 +14,48 @@ class SegmentOrderer(Processor):
         # segments= sorted(segments, key=sort_f)
         # segments= segments_to_numpy( segments )
         # return segments
-        mlh, mlw = self.max_line_height, self.max_line_width
-        s = segments.astype(numpy.uint32)  # prevent overflows
-        order = mlw * (s[:, 1] // mlh) + s[:, 0]
-        sort_order = numpy.argsort(order)
-        return segments[sort_order]
+        return segments[read_order(segments, self.max_line_height, self.max_line_width)]
+
+
+def read_order(segments, max_line_height=20, max_line_width=10000):
+    """returns the indexes that sort segments in read order, as SegmentOrderer does"""
+    s = segments.astype(numpy.uint32)  # prevent overflows
+    order = max_line_width * (s[:, 1] // max_line_height) + s[:, 0]
+    return numpy.argsort(order)
 
 
 class LineFinder(DisplayingProcessor):
+    """
+    finds the text lines' tops and bottoms. line_method can be "kmeans", which
+    tries many line counts and picks the most regular one, or "projection", which
+    groups segments on a single pass over their sorted vertical centers
+    """
+    PARAMETERS = DisplayingProcessor.PARAMETERS + {"line_method": "kmeans", "line_gap": 0.5}
+    DEBUG_ATTRIBUTES = DisplayingProcessor.DEBUG_ATTRIBUTES + ("image",)  # broadcast, for display
+
+    @staticmethod
+    def _group_lines(segments, line_gap=0.5):
+        """
+        groups segments into lines by sorting their vertical centers and splitting where
+        consecutive centers are further apart than line_gap times the median segment height.
+        returns the mean top and the mean bottom of each line
+        """
+        tops = segments[:, 1].astype(numpy.float32)
+        bottoms = tops + segments[:, 3]
+        centers = (tops + bottoms) / 2
+        order = numpy.argsort(centers, kind="mergesort")
+        gaps = numpy.diff(centers[order])
+        boundaries = numpy.flatnonzero(gaps > line_gap * numpy.median(segments[:, 3])) + 1
+        line_starts = numpy.zeros(len(segments), dtype=numpy.intp)
+        line_starts[boundaries] = 1
+        line_of_segment = numpy.empty(len(segments), dtype=numpy.intp)
+        line_of_segment[order] = numpy.cumsum(line_starts)
+        counts = numpy.bincount(line_of_segment)
+        line_tops = numpy.bincount(line_of_segment, weights=tops) / counts
+        line_bottoms = numpy.bincount(line_of_segment, weights=bottoms) / counts
+        shape = (len(counts), 1)  # same shape as _guess_lines
+        return line_tops.astype(numpy.float32).reshape(shape), line_bottoms.astype(numpy.float32).reshape(shape)
+
     @staticmethod
     def _guess_lines(ys, max_lines=50, confidence_minimum=0.0):
         """guesses and returns text inter-line distance, number of lines, y_position of first line"""
@@ -63,10 +97,15 @@ class LineFinder(DisplayingProcessor):
         return lines  # still floating points
 
     def _process(self, segments):
-        segment_tops = segments[:, 1]
-        segment_bottoms = segment_tops + segments[:, 3]
-        tops = self._guess_lines(segment_tops)
-        bottoms = self._guess_lines(segment_bottoms)
+        if self.line_method == "projection":
+            tops, bottoms = self._group_lines(segments, self.line_gap)
+        elif self.line_method == "kmeans":
+            segment_tops = segments[:, 1]
+            segment_bottoms = segment_tops + segments[:, 3]
+            tops = self._guess_lines(segment_tops)
+            bottoms = self._guess_lines(segment_bottoms)
+        else:
+            raise ValueError("Unknown line_method: {0}".format(self.line_method))
         if len(tops) != len(bottoms):
             raise Exception("different number of lines")
         middles = (tops + bottoms) / 2
@@ -99,6 +138,71 @@ def guess_segments_lines(segments, lines, nearline_tolerance=5.0):
     return line_of_y
 
 
+def _inverse_permutation(permutation):
+    inverse = numpy.empty_like(permutation)
+    inverse[permutation] = numpy.arange(len(permutation))
+    return inverse
+
+
+def _dominated(a, b, c, d):
+    """
+    given four permutations of range(n), returns a boolean array where
+    result[i] means there is a j with a[j]<a[i], b[j]<b[i], c[j]<c[i] and d[j]<d[i].
+    This is a divide and conquer over a, nested with another over b, with
+    each recursion level done at once, as array operations: O(n) memory and
+    O(log(n)**2) sorts of n elements.
+    """
+    n = len(a)
+    result = numpy.zeros(n, dtype=bool)
+    if n < 2:
+        return result
+    order = numpy.argsort(a)  # from now on, a is the position i
+    b, c, d = b[order].astype(numpy.int64), c[order].astype(numpy.int64), d[order].astype(numpy.int64)
+    i = numpy.arange(n, dtype=numpy.int64)
+    dominated = numpy.zeros(n, dtype=bool)
+    levels = int(n - 1).bit_length()
+    for outer in range(levels):
+        # pairs split by this level: j on the left half of a block, i on the right half
+        outer_block, outer_side = i >> (outer + 1), (i >> outer) & 1
+        # rank of b inside each outer block (blocks are contiguous ranges of i)
+        by_b = numpy.argsort(outer_block * n + b)
+        rank = numpy.empty(n, dtype=numpy.int64)
+        rank[by_b] = i - (outer_block[by_b] << (outer + 1))
+        for inner in range(outer + 1):
+            inner_block, inner_side = rank >> (inner + 1), (rank >> inner) & 1
+            sources = (outer_side == 0) & (inner_side == 0)
+            queries = (outer_side == 1) & (inner_side == 1)
+            if not (numpy.any(sources) and numpy.any(queries)):
+                continue
+            # 2d dominance on (c, d) inside each group: sort by c, running minimum of d over sources.
+            # groups are offset so that earlier groups' d are always larger than later groups' d
+            group = (outer_block << (outer + 1)) + inner_block  # inner_block < 2**(outer+1)
+            group_offset = (group.max() - group) * (n + 1)
+            by_c = numpy.argsort(group * n + c)
+            values = numpy.where(sources, d + group_offset, numpy.iinfo(numpy.int64).max)[by_c]
+            running_min = numpy.minimum.accumulate(values)
+            is_query = queries[by_c]
+            hit = running_min[is_query] < (d + group_offset)[by_c][is_query]
+            dominated[by_c[is_query][hit]] = True
+    result[order] = dominated
+    return result
+
+
+def contained_segments(segments):
+    """
+    returns a boolean array where result[i] means segments[i] is contained
+    inside some other segment. Equivalent to numpy.max(contained_segments_matrix(segments), axis=1),
+    without its n*n memory.
+    """
+    x1, y1 = segments[:, 0], segments[:, 1]
+    x2, y2 = x1 + segments[:, 2], y1 + segments[:, 3]
+    n = len(segments)
+    # ranks, with ties broken exactly as in contained_segments_matrix
+    x1r, x2r, y1r, y2r = [_inverse_permutation(numpy.argsort(v)) for v in (x1, x2, y1, y2)]
+    # a is inside b when x1[a]>x1[b], x2[a]<x2[b], y1[a]>y1[b] and y2[a]<y2[b] (in rank order)
+    return _dominated(x1r, (n - 1) - x2r, y1r, (n - 1) - y2r)
+
+
 def contained_segments_matrix(segments):
     """
     givens a n*n matrix m, n=len(segments), in which m[i,j] means
@@ -0,0 +1,257 @@
+"""
+A local OCR server, that keeps a trained OCR in memory between requests.
+Concurrent requests are segmented in parallel, and their features classified
+together, in micro-batches. This module needs python 3.
+
+Usage: python -m simpleocr.serve (--model DIRECTORY | --train IMAGE [IMAGE ...]) [--port PORT] ...
+POST an encoded image (png, jpg, ...) to /ocr to get {"chars", "classes", "segments", "latency"} as JSON;
+GET /metrics for latency and batch size statistics.
+"""
+import argparse
+import collections
+import json
+import os
+import queue
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from timeit import default_timer
+import cv2
+import numpy
+from .files import Image
+from .ocr import OCR, reconstruct_chars
+
+DEFAULT_PORT = 8765
+METRICS_WINDOW = 1000  # number of recent requests the latency metrics are computed over
+
+_extract_worker = threading.local()  # the OCR copy of each extraction thread
+
+
+def _init_extract_worker(ocr):
+    # a copy without the trained classifier, which stays in the batching thread
+    _extract_worker.ocr = ocr._thread_copy(share_classifier=False)
+
+
+def _extract(image_file):
+    return _extract_worker.ocr.extract(image_file)
+
+
+class _Request(object):
+    def __init__(self, features):
+        self.features = features
+        self.classes = None
+        self.error = None
+        self.batch_size = None
+        self.done = threading.Event()
+
+
+class OCRServer(object):
+    """
+    Runs a trained OCR for many concurrent callers. The segmentation and feature extraction
+    of each image runs on one of workers threads; a single batching thread then classifies
+    the features of up to batch_size images at once, waiting at most max_wait seconds
+    for a batch to fill. The OCR's cascade, if any, isn't used: its classifier classifies all glyphs.
+    """
+    def __init__(self, ocr, batch_size=32, max_wait=0.005, workers=None):
+        ocr._update_projection()  # before the extraction threads share it
+        self._ocr = ocr
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.workers = workers or os.cpu_count() or 1
+        self._executor = ThreadPoolExecutor(self.workers, initializer=_init_extract_worker, initargs=(ocr,))
+        self._queue = queue.Queue()
+        self._latencies = collections.deque(maxlen=METRICS_WINDOW)
+        self._batch_sizes = collections.deque(maxlen=METRICS_WINDOW)
+        self._requests = 0
+        self._lock = threading.Lock()
+        self._closed = False
+        self._batcher = threading.Thread(target=self._batch_loop, name="ocr-batcher")
+        self._batcher.daemon = True
+        self._batcher.start()
+
+    def ocr(self, image_file):
+        """
+        returns ((chars, classes, segments), latency), latency being a dict of the seconds spent on each stage.
+        Raises RuntimeError once the server is closed
+        """
+        if self._closed:
+            raise RuntimeError("The OCRServer is closed")
+        start = default_timer()
+        segments, features = self._executor.submit(_extract, image_file).result()
+        extracted = default_timer()
+        request = _Request(features)
+        with self._lock:  # so no request is queued after close's sentinel
+            if self._closed:
+                raise RuntimeError("The OCRServer is closed")
+            self._queue.put(request)
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        end = default_timer()
+        latency = {"extract": extracted - start, "classify": end - extracted, "total": end - start,
+                   "batch_size": request.batch_size}
+        with self._lock:
+            self._requests += 1
+            self._latencies.append(latency)
+        return (reconstruct_chars(request.classes), request.classes, segments), latency
+
+    def _next_batch(self):
+        """returns the next batch of requests, and whether the server was closed after them"""
+        request = self._queue.get()
+        if request is None:
+            return [], True
+        batch = [request]
+        deadline = default_timer() + self.max_wait
+        while len(batch) < self.batch_size:
+            timeout = deadline - default_timer()
+            if timeout <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if request is None:
+                return batch, True
+            batch.append(request)
+        return batch, False
+
+    def _batch_loop(self):
+        closed = False
+        while not closed:
+            batch, closed = self._next_batch()
+            if batch:
+                self._classify(batch)
+
+    def _classify(self, batch):
+        """classifies the features of a batch of requests at once, and signals them"""
+        try:
+            features = numpy.concatenate([r.features for r in batch])
+            classes = self._ocr.classifier.classify(features) if len(features) else \
+                numpy.empty((0, 1), dtype=numpy.float32)
+            ends = numpy.cumsum([len(r.features) for r in batch])
+            for r, part in zip(batch, numpy.split(classes, ends[:-1])):
+                r.classes = part
+        except Exception as e:
+            for r in batch:
+                r.error = e
+        with self._lock:
+            self._batch_sizes.append(len(batch))
+        for r in batch:
+            r.batch_size = len(batch)
+            r.done.set()
+
+    def get_metrics(self):
+        """returns the number of requests, and percentiles of the recent latencies and batch sizes"""
+        with self._lock:
+            latencies, batch_sizes, requests = list(self._latencies), list(self._batch_sizes), self._requests
+        metrics = {"requests": requests, "batches": len(batch_sizes),
+                   "batch_size": {"mean": float(numpy.mean(batch_sizes)) if batch_sizes else None,
+                                  "max": max(batch_sizes) if batch_sizes else None}}
+        for stage in ("extract", "classify", "total"):
+            values = [l[stage] for l in latencies]
+            metrics[stage] = dict(("p{0}".format(p), float(numpy.percentile(values, p)) if values else None)
+                                  for p in (50, 90, 99))
+        return metrics
+
+    def close(self):
+        """answers the requests in progress, then stops the server"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(None)
+        self._batcher.join()
+        self._executor.shutdown()
+
+
+def _to_json(result, latency):
+    chars, classes, segments = result
+    return {"chars": chars, "classes": numpy.ravel(classes).astype(int).tolist(),
+            "segments": numpy.asarray(segments).astype(int).tolist(), "latency": latency}
+
+
+class OCRRequestHandler(BaseHTTPRequestHandler):
+    server_version = "simpleocr"
+
+    def _reply(self, code, data):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/metrics":
+            self._reply(200, self.server.ocr_server.get_metrics())
+        else:
+            self._reply(404, {"error": "not found"})
+
+    def do_POST(self):
+        if self.path != "/ocr":
+            return self._reply(404, {"error": "not found"})
+        try:
+            length = int(self.headers.get("Content-Length", ""))
+        except ValueError:
+            return self._reply(400, {"error": "a valid Content-Length is required"})
+        if length <= 0:
+            return self._reply(400, {"error": "the request body is empty"})
+        data = self.rfile.read(length)
+        try:
+            image = cv2.imdecode(numpy.frombuffer(data, dtype=numpy.uint8), cv2.IMREAD_COLOR)
+        except cv2.error:
+            image = None
+        if image is None:
+            return self._reply(400, {"error": "the request body is not a image"})
+        try:
+            result, latency = self.server.ocr_server.ocr(Image(image))
+        except Exception as e:
+            return self._reply(500, {"error": str(e)})
+        self._reply(200, _to_json(result, latency))
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+
+def create_http_server(ocr_server, port=DEFAULT_PORT, verbose=False):
+    """returns a (not yet serving) HTTP server for ocr_server, listening on localhost"""
+    http_server = ThreadingHTTPServer(("127.0.0.1", port), OCRRequestHandler)
+    http_server.daemon_threads = True
+    http_server.ocr_server = ocr_server
+    http_server.verbose = verbose
+    return http_server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m simpleocr.serve", description=__doc__.strip().split("\n")[0])
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--model", help="directory of a model written by OCR.save")
+    source.add_argument("--train", nargs="+", help="grounded images to train on")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--batch-size", type=int, default=32, help="maximum number of images classified at once")
+    parser.add_argument("--max-wait", type=float, default=5.0, help="milliseconds to wait for a batch to fill")
+    parser.add_argument("--workers", type=int, default=None, help="segmentation threads (default: number of CPUs)")
+    parser.add_argument("--verbose", action="store_true", help="log every request")
+    args = parser.parse_args(argv)
+    if args.model:
+        ocr = OCR.load(args.model)
+    else:
+        ocr = OCR()
+        for path in args.train:
+            ocr.train(path)
+    ocr_server = OCRServer(ocr, batch_size=args.batch_size, max_wait=args.max_wait / 1000.0, workers=args.workers)
+    http_server = create_http_server(ocr_server, args.port, args.verbose)
+    sys.stderr.write("serving on http://127.0.0.1:{0}\n".format(http_server.server_address[1]))
+    try:
+        http_server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        http_server.server_close()
+        ocr_server.close()
+
+
+if __name__ == "__main__":
+    main()
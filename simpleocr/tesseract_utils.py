@@ -1,23 +1,78 @@
-from .classification import classes_from_numpy, classes_to_numpy
-from .segmentation import segments_from_numpy, segments_to_numpy
+from .classification import classes_to_numpy, CLASS_DATATYPE
+from .segmentation import SEGMENT_DATATYPE
 import io
+import os
+import re
+import tempfile
+import numpy
 
+BOX_SIDECAR_EXTENSION = ".npz"  # appended to the box file path
+_FIRST_CHAR = re.compile(u"^.", re.MULTILINE)
 
-def read_boxfile(path):
-    classes = []
-    segments = []
+
+def parse_boxfile(text):
+    """parses the contents of a box file, returning numpy (classes, segments)"""
+    classes = _FIRST_CHAR.findall(text)
+    numbers = numpy.fromstring(_FIRST_CHAR.sub(u"", text), dtype=numpy.int64, sep=" ")
+    if numbers.size != 5 * len(classes):
+        raise ValueError("Malformed box file: expected 5 numbers in each of the {0} lines".format(len(classes)))
+    numbers = numbers.reshape(-1, 5)
+    if numpy.any(numbers[:, 4] != 0):
+        raise ValueError("Malformed box file: the last number of each line must be 0")
+    return classes_to_numpy(classes), numbers[:, :4].astype(SEGMENT_DATATYPE)
+
+
+def _box_stat(path):
+    """identifies a version of the box file, so a sidecar can tell if it's outdated"""
+    st = os.stat(path)
+    return numpy.array([st.st_size, int(st.st_mtime * 1e9)], dtype=numpy.int64)
+
+
+def _read_sidecar(path):
+    """returns the (classes, segments) of a box file's sidecar, or None if it's missing or outdated"""
+    try:
+        with numpy.load(path + BOX_SIDECAR_EXTENSION) as sidecar:
+            if numpy.array_equal(sidecar["box_stat"], _box_stat(path)):
+                return sidecar["classes"], sidecar["segments"]
+    except (IOError, OSError, KeyError, ValueError):
+        pass
+    return None
+
+
+def _write_sidecar(path, classes, segments):
+    fd, temporary = tempfile.mkstemp(suffix=".tmp", dir=os.path.dirname(os.path.abspath(path)))
+    with os.fdopen(fd, "wb") as f:
+        numpy.savez(f, classes=classes, segments=segments, box_stat=_box_stat(path))
+    try:
+        os.replace(temporary, path + BOX_SIDECAR_EXTENSION)
+    except AttributeError:  # python 2
+        os.rename(temporary, path + BOX_SIDECAR_EXTENSION)
+
+
+def read_boxfile(path, sidecar=False):
+    """
+    Reads a box file, returning numpy (classes, segments).
+    If sidecar is True, a binary copy of the data is kept next to the box file
+    (path + BOX_SIDECAR_EXTENSION) and read instead of it, while the box file is unchanged.
+    """
+    if sidecar:
+        data = _read_sidecar(path)
+        if data is not None:
+            return data
     with io.open(path, encoding="utf-8") as f:
-        for line in f:
-            s = line.split(" ")
-            assert len(s) == 6
-            assert s[5] == '0\n'
-            classes.append(s[0])
-            segments.append(list(map(int, s[1:5])))
-    return classes_to_numpy(classes), segments_to_numpy(segments)
-
-
-def write_boxfile(path, classes, segments):
-    classes, segments = classes_from_numpy(classes), segments_from_numpy(segments)
-    with io.open(path, 'w') as f:
-        for c, s in zip(classes, segments):
-            f.write(c + ' ' + ' '.join(map(str, s)) + " 0\n")
+        classes, segments = parse_boxfile(f.read())
+    if sidecar:
+        try:
+            _write_sidecar(path, classes, segments)
+        except (IOError, OSError):
+            pass  # e.g. a read-only data directory; the box file is enough
+    return classes, segments
+
+
+def write_boxfile(path, classes, segments, sidecar=False):
+    chars = numpy.ravel(classes).astype("<u4").tobytes().decode("utf-32-le")
+    lines = [u"{0} {1} {2} {3} {4} 0\n".format(c, *s) for c, s in zip(chars, segments.tolist())]
+    with io.open(path, 'w', encoding="utf-8") as f:
+        f.write(u"".join(lines))
+    if sidecar:
+        _write_sidecar(path, numpy.asarray(classes, dtype=CLASS_DATATYPE), segments)
@@ -0,0 +1,220 @@
+"""
+OCR of frame sequences (videos, cameras, ...) where most of each frame is unchanged from the
+previous one, like counters and readouts: only the regions that changed are processed again.
+"""
+import numpy
+import cv2
+from .files import Image
+from .ocr import reconstruct_chars
+from .segmentation_aux import read_order
+
+MAX_REGION_PASSES = 3  # times the changed regions are grown to glyphs crossing their borders, before giving up
+
+
+def read_frames(source):
+    """yields the (BGR) frames of a cv2.VideoCapture source: a video file path, a camera index or a stream url"""
+    capture = cv2.VideoCapture(source)
+    if not capture.isOpened():
+        raise IOError("Can't open video source {0!r}".format(source))
+    try:
+        while True:
+            ok, frame = capture.read()
+            if not ok:
+                return
+            yield frame
+    finally:
+        capture.release()
+
+
+def changed_tiles(difference, tile_size, threshold):
+    """
+    given the absolute difference of two frames, returns a boolean array with a element per
+    tile_size*tile_size tile (the last row and column of tiles may be smaller), True where
+    some pixel changed by more than threshold
+    """
+    height, width = difference.shape[:2]
+    channels = difference.shape[2] if difference.ndim == 3 else 1
+    difference = difference.reshape(height, width * channels)
+    full_rows = height // tile_size
+    rows = numpy.empty((-(-height // tile_size), width * channels), dtype=difference.dtype)
+    # the maximum of each row of tiles. Much faster than reduceat, for whole tiles
+    difference[:full_rows * tile_size].reshape(full_rows, tile_size, -1).max(axis=1, out=rows[:full_rows])
+    if full_rows < len(rows):
+        difference[full_rows * tile_size:].max(axis=0, out=rows[full_rows])
+    tiles = numpy.maximum.reduceat(rows, numpy.arange(0, width, tile_size) * channels, axis=1)
+    return tiles > threshold
+
+
+def changed_regions(difference, tile_size, threshold):
+    """
+    given the absolute difference of two frames, returns the [x0, y0, x1, y1] bounding boxes
+    of the pixels that changed by more than threshold, in each group of changed tiles
+    """
+    changed = changed_tiles(difference, tile_size, threshold)
+    _, _, stats, _ = cv2.connectedComponentsWithStats(changed.astype(numpy.uint8), connectivity=8)
+    regions = []
+    for x, y, w, h, _ in stats[1:]:  # the first component is the unchanged background
+        x0, y0 = x * tile_size, y * tile_size
+        tiles = difference[y0:(y + h) * tile_size, x0:(x + w) * tile_size]
+        if tiles.ndim == 3:
+            tiles = tiles.max(axis=2)
+        x, y, w, h = cv2.boundingRect((tiles > threshold).astype(numpy.uint8))
+        regions.append([x0 + x, y0 + y, x0 + x + w, y0 + y + h])
+    return regions, changed.mean()
+
+
+def _boxes(segments):
+    """returns the [x0, y0, x1, y1] boxes of (x, y, width, height) segments"""
+    s = segments.astype(numpy.intp)
+    return numpy.column_stack((s[:, 0], s[:, 1], s[:, 0] + s[:, 2], s[:, 1] + s[:, 3]))
+
+
+def _intersecting(boxes, region):
+    """returns a boolean array, True where the [x0, y0, x1, y1] boxes intersect region"""
+    x0, y0, x1, y1 = region
+    return (boxes[:, 0] < x1) & (boxes[:, 2] > x0) & (boxes[:, 1] < y1) & (boxes[:, 3] > y0)
+
+
+def _grow_regions(regions, boxes):
+    """
+    grows the regions until each glyph box is either inside or outside all of them,
+    merging the regions that overlap
+    """
+    grown = True
+    while grown:
+        grown = False
+        for region in regions:
+            inside = _intersecting(boxes, region)
+            if inside.any():
+                union = [min(region[0], boxes[inside, 0].min()), min(region[1], boxes[inside, 1].min()),
+                         max(region[2], boxes[inside, 2].max()), max(region[3], boxes[inside, 3].max())]
+                if union != region:
+                    region[:] = union
+                    grown = True
+        merged = []
+        for region in regions:
+            for other in merged:
+                if _intersecting(numpy.array([other]), region)[0]:
+                    other[:] = [min(region[0], other[0]), min(region[1], other[1]),
+                                max(region[2], other[2]), max(region[3], other[3])]
+                    grown = True
+                    break
+            else:
+                merged.append(region)
+        regions = merged
+    return regions
+
+
+class FrameOCR(object):
+    """
+    Runs a trained OCR on a sequence of frames of the same size, keeping the glyphs of the last one.
+    Each frame is compared to the pixels its glyphs were read from, in tiles; the groups of changed
+    tiles (grown to whole glyphs) are processed as regions of interest of OCR.ocr, with a margin
+    around them so the blur and threshold see the same neighbourhood as on the whole frame,
+    and the glyphs of the rest are reused. So the time per frame depends on how much changes,
+    not on the frame size.
+    The first frame, and frames where too much changed, are processed whole, as are frames where
+    the segmentation of a region fails: ContourSegmenter's default (kmeans) LineFinder needs more
+    glyphs than a few, so segmenters with line_method="projection" are best suited.
+    Filters that depend on the whole frame (like the line ones) only see each region, so a
+    few (misaligned) glyphs may be kept or dropped differently than on the whole frame.
+    """
+    def __init__(self, ocr, tile_size=32, threshold=32, margin=8, max_changed=0.5, roi_workers=1):
+        """
+        :param ocr: a trained OCR
+        :param tile_size: side of the (square) tiles the frames are compared in, in pixels
+        :param threshold: minimum difference of a pixel's level for it to change
+        :param margin: pixels of context segmented around each changed region (the glyphs centered
+        in it are ignored). Should exceed the reach of the segmenter's blur and threshold block
+        :param max_changed: fraction of changed tiles above which the whole frame is processed
+        :param roi_workers: number of threads segmenting the changed regions
+        """
+        self._ocr = ocr
+        self.tile_size = tile_size
+        self.threshold = threshold
+        self.margin = margin
+        self.max_changed = max_changed
+        self.roi_workers = roi_workers
+        self.regions = None  # (x, y, width, height) processed on the last frame, or None if it was processed whole
+        self.reset()
+
+    def reset(self):
+        """forgets the last frame, so the next one is processed whole"""
+        self._reference = None  # the pixels the glyphs were read from
+        self._classes = None
+        self._segments = None
+
+    def _result(self):
+        return reconstruct_chars(self._classes), self._classes, self._segments
+
+    def _ocr_whole(self, frame):
+        _, self._classes, self._segments = self._ocr.ocr(Image(frame))
+        self._reference = frame.copy()
+        self.regions = None
+        return self._result()
+
+    def ocr(self, frame):
+        """returns (chars, classes, segments) of a frame, given as a image (array) or Image"""
+        if isinstance(frame, Image):
+            frame = frame.image
+        if self._reference is None or self._reference.shape != frame.shape:
+            return self._ocr_whole(frame)
+        difference = cv2.absdiff(self._reference, frame)
+        regions, changed = changed_regions(difference, self.tile_size, self.threshold)
+        if changed > self.max_changed:
+            return self._ocr_whole(frame)
+        boxes = _boxes(self._segments)
+        regions = _grow_regions(regions, boxes)
+        if not regions:
+            self.regions = []
+            return self._result()
+        for _ in range(MAX_REGION_PASSES):
+            try:
+                results = self._ocr_regions(frame, regions)
+            except Exception:  # the segmenter's filters may fail on regions with too few glyphs
+                break
+            # glyphs crossing a region's border were cut by its margin, or joined glyphs outside it
+            crossing = [c for _, _, c in results if len(c)]
+            crossing = numpy.concatenate(crossing) if crossing else numpy.empty((0, 4), dtype=numpy.intp)
+            if not len(crossing):
+                return self._update(frame, regions, boxes, results)
+            regions = _grow_regions(regions, numpy.concatenate((boxes, crossing)))
+        return self._ocr_whole(frame)
+
+    def _ocr_regions(self, frame, regions):
+        """
+        returns the (classes, segments, crossing) of each region: the glyphs centered in it,
+        and the [x0, y0, x1, y1] boxes of those that cross its border
+        """
+        height, width = frame.shape[:2]
+        m = self.margin
+        rois = [(max(x0 - m, 0), max(y0 - m, 0), min(x1 + m, width) - max(x0 - m, 0),
+                 min(y1 + m, height) - max(y0 - m, 0)) for x0, y0, x1, y1 in regions]
+        results = []
+        roi_results = self._ocr.ocr(Image(frame), rois=rois, roi_workers=self.roi_workers)
+        for (x0, y0, x1, y1), (_, classes, segments) in zip(regions, roi_results):
+            box = _boxes(segments)
+            cx, cy = (box[:, 0] + box[:, 2]) // 2, (box[:, 1] + box[:, 3]) // 2
+            centered = (cx >= x0) & (cx < x1) & (cy >= y0) & (cy < y1)
+            inside = (box[:, 0] >= x0) & (box[:, 2] <= x1) & (box[:, 1] >= y0) & (box[:, 3] <= y1)
+            crossing = _intersecting(box, (x0, y0, x1, y1)) & ~inside
+            results.append((classes[centered], segments[centered], box[crossing]))
+        return results
+
+    def _update(self, frame, regions, boxes, results):
+        """replaces the glyphs in the regions by the ones found in them, and returns the frame's result"""
+        kept = numpy.ones(len(boxes), dtype=bool)
+        for x0, y0, x1, y1 in regions:
+            kept &= ~_intersecting(boxes, (x0, y0, x1, y1))
+            self._reference[y0:y1, x0:x1] = frame[y0:y1, x0:x1]
+        classes = numpy.concatenate([self._classes[kept]] + [c for c, _, _ in results])
+        segments = numpy.concatenate([self._segments[kept]] + [s for _, s, _ in results])
+        order = read_order(segments)
+        self._classes, self._segments = classes[order], segments[order]
+        self.regions = [(x0, y0, x1 - x0, y1 - y0) for x0, y0, x1, y1 in regions]
+        return self._result()
+
+    def ocr_stream(self, frames):
+        """yields the (chars, classes, segments) of each frame, given as a iterable of images or Images"""
+        for frame in frames:
+            yield self.ocr(frame)
@@ -0,0 +1,19 @@
+"""The PIL image enhancement path, which EnhanceProcessor replaced, as a reference for tests and benchmarks"""
+from PIL import ImageEnhance, ImageOps
+from simpleocr.pillow_utils import image_to_pil, pil_to_cv_array
+
+
+def pil_enhance(image_file, color=None, brightness=None, contrast=None, sharpness=None, invert=False):
+    """the PIL enhancement path, as improver.enhance_image used to run it"""
+    image = image_to_pil(image_file)
+    if color is not None:
+        image = ImageEnhance.Color(image).enhance(color)
+    if brightness is not None:
+        image = ImageEnhance.Brightness(image).enhance(brightness)
+    if contrast is not None:
+        image = ImageEnhance.Contrast(image).enhance(contrast)
+    if sharpness is not None:
+        image = ImageEnhance.Sharpness(image).enhance(sharpness)
+    if invert:
+        image = ImageOps.invert(image)
+    return pil_to_cv_array(image)
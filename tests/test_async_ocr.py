@@ -0,0 +1,67 @@
+import asyncio
+import unittest
+import numpy
+from simpleocr.segmentation import ContourSegmenter
+from simpleocr.feature_extraction import SimpleFeatureExtractor
+from simpleocr.files import open_image, Image
+from simpleocr.classification import KNNClassifier
+from simpleocr.ocr import OCR
+from simpleocr.async_ocr import AsyncOCR, _thread_worker
+
+
+class TestAsyncOCR(unittest.TestCase):
+    def setUp(self):
+        self.ocr = OCR(ContourSegmenter(blur_y=5, blur_x=5), SimpleFeatureExtractor(), KNNClassifier())
+        self.ocr.train(open_image('digits1'))
+        self.images = ['digits2', 'digits1', open_image('digits2'), 'digits1']
+        self.expected = [self.ocr.ocr(image)[0] for image in self.images]
+
+    def _run(self, executor):
+        async def run():
+            async with AsyncOCR(self.ocr, workers=2, executor=executor, max_pending=2) as aocr:
+                single = await asyncio.gather(*[aocr(image) for image in self.images])
+                self.assertEqual(aocr.queue_depth, {"pending": 0, "waiting": 0})
+                ordered = [r async for r in aocr.ocr_stream(self.images)]
+                unordered = [r async for r in aocr.ocr_stream(self.images, ordered=False)]
+            return single, ordered, unordered
+        single, ordered, unordered = asyncio.run(run())
+        self.assertEqual([chars for chars, _, _ in single], self.expected)
+        self.assertEqual([chars for chars, _, _ in ordered], self.expected)
+        unordered = dict((i, chars) for i, (chars, _, _) in unordered)
+        self.assertEqual([unordered[i] for i in range(len(self.images))], self.expected)
+
+    def test_threads(self):
+        self._run("thread")
+
+    def test_processes(self):
+        self._run("process")
+
+    def test_timeout(self):
+        async def run():
+            async with AsyncOCR(self.ocr, workers=1) as aocr:
+                await aocr(self.images[0], timeout=1e-6)
+        with self.assertRaises(asyncio.TimeoutError):
+            asyncio.run(run())
+
+    def test_timeout_keeps_slot(self):
+        async def run():
+            large = Image(numpy.tile(open_image('digits2').image, (4, 4, 1)))  # takes much longer than timeout
+            async with AsyncOCR(self.ocr, workers=1, max_pending=1) as aocr:
+                with self.assertRaises(asyncio.TimeoutError):
+                    await aocr(large, timeout=0.02)
+                # the timed out call is still running on the pool, so it keeps its slot
+                self.assertEqual(aocr.queue_depth["pending"], 1)
+                chars, _, _ = await aocr(self.images[1])
+                self.assertEqual(aocr.queue_depth, {"pending": 0, "waiting": 0})
+            return chars
+        self.assertEqual(asyncio.run(run()), self.expected[1])
+
+    def test_threads_share_classifier(self):
+        aocr = AsyncOCR(self.ocr, workers=2)
+        try:
+            shared = aocr._executor.submit(lambda: _thread_worker.ocr.classifier is self.ocr.classifier).result()
+            segmenter = aocr._executor.submit(lambda: _thread_worker.ocr.segmenter).result()
+        finally:
+            aocr.close()
+        self.assertTrue(shared)
+        self.assertIsNot(segmenter, self.ocr.segmenter)
@@ -0,0 +1,79 @@
+import unittest
+import pickle
+import numpy
+from simpleocr.files import open_image
+from simpleocr.feature_extraction import SimpleFeatureExtractor
+from simpleocr.classification import KNNClassifier, BruteForceKNNClassifier, KDTreeKNNClassifier, vote
+
+
+class TestKNNClassifier(unittest.TestCase):
+    def setUp(self):
+        extractor = SimpleFeatureExtractor()
+        self.samples = []
+        for name in ('digits1', 'digits2'):
+            img = open_image(name)
+            self.samples.append((extractor.extract(img.image, img.ground.segments), img.ground.classes))
+
+    def test_add_samples(self):
+        features = numpy.concatenate([f for f, _ in self.samples])
+        classes = numpy.concatenate([c for _, c in self.samples])
+        trained = KNNClassifier()
+        trained.train(features, classes)
+        incremental = KNNClassifier()
+        for f, c in self.samples:
+            for i in range(0, len(f), 7):
+                incremental.add_samples(f[i:i + 7], c[i:i + 7])
+        for a, b in zip(trained.get_samples(), incremental.get_samples()):
+            self.assertTrue(numpy.array_equal(a, b))
+        self.assertTrue(numpy.array_equal(trained.classify(features), incremental.classify(features)))
+
+    def test_train_replaces_samples(self):
+        classifier = KNNClassifier()
+        (f1, c1), (f2, c2) = self.samples
+        classifier.add_samples(f1, c1)
+        classifier.train(f2, c2)
+        self.assertEqual(len(classifier.get_samples()[0]), len(f2))
+
+
+class TestNumpyClassifiers(unittest.TestCase):
+    def setUp(self):
+        extractor = SimpleFeatureExtractor()
+        self.train_image, self.test_image = open_image('digits1'), open_image('digits2')
+        self.train_features = extractor.extract(self.train_image.image, self.train_image.ground.segments)
+        self.test_features = extractor.extract(self.test_image.image, self.test_image.ground.segments)
+
+    def test_same_as_opencv(self):
+        for k in (1, 3):
+            expected = KNNClassifier(k=k)
+            expected.train(self.train_features, self.train_image.ground.classes)
+            expected = expected.classify(self.test_features)
+            for classifier in (BruteForceKNNClassifier(k=k, max_block_bytes=2 ** 16), KDTreeKNNClassifier(k=k)):
+                classifier.train(self.train_features, self.train_image.ground.classes)
+                self.assertTrue(numpy.array_equal(classifier.classify(self.test_features), expected))
+                unpickled = pickle.loads(pickle.dumps(classifier))
+                self.assertTrue(numpy.array_equal(unpickled.classify(self.test_features), expected))
+
+    def test_classify_with_distances(self):
+        difference = self.test_features[:, numpy.newaxis, :] - self.train_features[numpy.newaxis, :, :]
+        expected = numpy.min(numpy.sum(difference.astype(numpy.float64) ** 2, axis=2), axis=1)
+        for classifier in (KNNClassifier(), BruteForceKNNClassifier(), KDTreeKNNClassifier()):
+            classifier.train(self.train_features, self.train_image.ground.classes)
+            classes, distances = classifier.classify_with_distances(self.test_features)
+            self.assertTrue(numpy.array_equal(classes, classifier.classify(self.test_features)))
+            self.assertEqual(distances.shape, (len(self.test_features), 1))
+            self.assertTrue(numpy.allclose(distances[:, 0], expected, rtol=1e-5))
+
+    def test_nearest_distances(self):
+        rng = numpy.random.RandomState(0)
+        samples = rng.randint(0, 10, size=(500, 3)).astype(numpy.float32)
+        queries = rng.randint(0, 10, size=(50, 3)).astype(numpy.float32)
+        expected = numpy.sort(numpy.sum((queries[:, numpy.newaxis] - samples) ** 2, axis=2), axis=1)[:, :4]
+        for classifier in (BruteForceKNNClassifier(k=4), KDTreeKNNClassifier(k=4, leaf_size=8)):
+            classifier.train(samples, numpy.zeros((500, 1)))
+            classifier.classify(queries[:1])
+            distances, _ = classifier._nearest(queries)
+            self.assertTrue(numpy.array_equal(distances, expected))
+
+    def test_vote(self):
+        neighbours = numpy.array([[1, 2, 2], [3, 4, 5], [6, 7, 6]])
+        self.assertEqual(vote(neighbours).tolist(), [[2], [3], [6]])
@@ -0,0 +1,57 @@
+import os
+import shutil
+import tempfile
+import unittest
+import mock
+import numpy
+from simpleocr.files import open_image
+from simpleocr.feature_cache import FeatureCache
+from simpleocr.feature_extraction import SimpleFeatureExtractor
+from simpleocr.ocr import OCR
+
+
+class TestFeatureCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.img = open_image('digits1')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_key(self):
+        segments = self.img.ground.segments
+        key = FeatureCache.key(self.img.image, segments, SimpleFeatureExtractor())
+        self.assertEqual(key, FeatureCache.key(self.img.image.copy(), segments.copy(), SimpleFeatureExtractor()))
+        self.assertNotEqual(key, FeatureCache.key(self.img.image, segments[1:], SimpleFeatureExtractor()))
+        self.assertNotEqual(key, FeatureCache.key(self.img.image, segments, SimpleFeatureExtractor(feature_size=8)))
+
+    def test_extract(self):
+        cache = FeatureCache(self.directory)
+        extractor = SimpleFeatureExtractor()
+        expected = extractor.extract(self.img.image, self.img.ground.segments)
+        with mock.patch.object(extractor, 'extract', wraps=extractor.extract) as extract:
+            for _ in range(2):
+                features = cache.extract(extractor, self.img.image, self.img.ground.segments)
+                self.assertTrue(numpy.array_equal(features, expected))
+            self.assertEqual(extract.call_count, 1)
+
+    def test_eviction(self):
+        block = numpy.zeros((10, 100), dtype=numpy.float32)
+        cache = FeatureCache(self.directory, max_bytes=3 * block.nbytes + 1000)
+        for i in range(5):
+            cache.put("block{0}".format(i), block)
+            os.utime(cache._path("block{0}".format(i)), (i, i))  # deterministic use order
+        self.assertLessEqual(sum(os.path.getsize(os.path.join(self.directory, f)) for f in os.listdir(self.directory)),
+                             cache.max_bytes)
+        self.assertIsNone(cache.get("block0"))
+        self.assertIsNotNone(cache.get("block4"))
+
+    def test_ocr_train(self):
+        ocr = OCR(feature_cache=FeatureCache(self.directory))
+        ocr.train(self.img)
+        cached = OCR(feature_cache=FeatureCache(self.directory))
+        with mock.patch.object(cached.extractor, 'extract') as extract:
+            cached.train(self.img)
+            self.assertFalse(extract.called)
+        for a, b in zip(ocr.classifier.get_samples(), cached.classifier.get_samples()):
+            self.assertTrue(numpy.array_equal(a, b))
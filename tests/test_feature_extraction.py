@@ -0,0 +1,30 @@
+import unittest
+import numpy
+from simpleocr.files import open_image
+from simpleocr.feature_extraction import SimpleFeatureExtractor, FEATURE_DATATYPE
+
+
+class TestSimpleFeatureExtractor(unittest.TestCase):
+    def setUp(self):
+        self.img = open_image('digits1')
+        self.segments = self.img.ground.segments
+
+    def test_extract_shape(self):
+        for stretch in (False, True):
+            extractor = SimpleFeatureExtractor(feature_size=12, stretch=stretch)
+            features = extractor.extract(self.img.image, self.segments)
+            self.assertEqual(features.shape, (len(self.segments), 12 ** 2))
+            self.assertEqual(features.dtype, FEATURE_DATATYPE)
+
+    def test_extract_empty(self):
+        extractor = SimpleFeatureExtractor()
+        features = extractor.extract(self.img.image, self.segments[:0])
+        self.assertEqual(features.shape, (0, 10 ** 2))
+
+    def test_extract_is_per_segment(self):
+        # features of a segment don't depend on which other segments are extracted with it
+        extractor = SimpleFeatureExtractor()
+        features = extractor.extract(self.img.image, self.segments)
+        for i in (0, len(self.segments) // 2, len(self.segments) - 1):
+            single = extractor.extract(self.img.image, self.segments[i:i + 1])
+            self.assertTrue(numpy.array_equal(single[0], features[i]))
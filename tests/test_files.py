@@ -1,8 +1,12 @@
 import os
+import shutil
+import tempfile
 import unittest
+import numpy
 from PIL import Image as PillowImage
 import simpleocr.files
 from simpleocr.files import open_image
+from simpleocr.tesseract_utils import read_boxfile, write_boxfile, parse_boxfile, BOX_SIDECAR_EXTENSION
 
 TEST_FILE = 'digits1'
 TEST_FILE_EXT = 'digits1.png'
@@ -45,6 +49,16 @@ class TestImageFile(unittest.TestCase):
         imgf.remove_ground(remove_file=False)
         self.assertEqual(imgf.is_grounded, False)
 
+    def test_lazy_loading(self):
+        imgf = open_image(TEST_FILE)
+        self.assertIsNone(imgf._image)
+        self.assertFalse(imgf._ground_loaded)
+        self.assertEqual(imgf.image.shape[2], 3)
+        self.assertTrue(imgf.is_grounded)
+        imgf.release_image()
+        self.assertIsNone(imgf._image)
+        self.assertEqual(imgf.image.shape[2], 3)
+
     def test_ground_unicode(self):
         imgf = open_image(UNICODE_TEST_FILE)
         self.assertEqual(imgf.is_grounded, True)
@@ -52,3 +66,40 @@ class TestImageFile(unittest.TestCase):
         self.assertEqual(imgf.is_grounded, True)
         imgf.remove_ground(remove_file=False)
         self.assertEqual(imgf.is_grounded, False)
+
+
+class TestBoxFile(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "test.box")
+        self.ground = open_image(UNICODE_TEST_FILE).ground
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_write_read(self):
+        write_boxfile(self.path, self.ground.classes, self.ground.segments)
+        with open(self.ground.path, "rb") as original, open(self.path, "rb") as written:
+            self.assertEqual(original.read(), written.read())
+        classes, segments = read_boxfile(self.path)
+        self.assertTrue(numpy.array_equal(classes, self.ground.classes))
+        self.assertTrue(numpy.array_equal(segments, self.ground.segments))
+        self.assertEqual(segments.dtype, self.ground.segments.dtype)
+
+    def test_malformed(self):
+        with self.assertRaises(ValueError):
+            parse_boxfile(u"a 1 2 3 4 0\nb 1 2 3 0\n")
+        with self.assertRaises(ValueError):
+            parse_boxfile(u"a 1 2 3 4 1\n")
+
+    def test_sidecar(self):
+        write_boxfile(self.path, self.ground.classes, self.ground.segments, sidecar=True)
+        self.assertTrue(os.path.exists(self.path + BOX_SIDECAR_EXTENSION))
+        classes, segments = read_boxfile(self.path, sidecar=True)
+        self.assertTrue(numpy.array_equal(classes, self.ground.classes))
+        self.assertTrue(numpy.array_equal(segments, self.ground.segments))
+        # the box file stays authoritative: editing it outdates the sidecar
+        write_boxfile(self.path, self.ground.classes[:3], self.ground.segments[:3])
+        classes, segments = read_boxfile(self.path, sidecar=True)
+        self.assertEqual(len(classes), 3)
+        self.assertTrue(numpy.array_equal(segments, self.ground.segments[:3]))
@@ -1,9 +1,15 @@
+import os
+import pickle
 import unittest
-from simpleocr.segmentation import ContourSegmenter
-from simpleocr.feature_extraction import SimpleFeatureExtractor
-from simpleocr.files import open_image
-from simpleocr.classification import KNNClassifier
-from simpleocr.ocr import OCR, reconstruct_chars
+import shutil
+import tempfile
+import numpy
+import simpleocr.files
+from simpleocr.segmentation import ContourSegmenter, TiledContourSegmenter, PyramidContourSegmenter
+from simpleocr.feature_extraction import SimpleFeatureExtractor, PCAProjection
+from simpleocr.files import open_image, Image
+from simpleocr.classification import KNNClassifier, classes_to_numpy, BLANK_CLASS
+from simpleocr.ocr import OCR, CascadeStage, reconstruct_chars
 
 
 class TestOCR(unittest.TestCase):
@@ -29,3 +35,170 @@ class TestOCR(unittest.TestCase):
 
     def test_ocr_unicode(self):
         self._test_ocr(open_image('unicode1'), open_image('unicode1'))
+
+    def test_ocr_batch(self):
+        ocr = OCR(ContourSegmenter(blur_y=5, blur_x=5), SimpleFeatureExtractor(), KNNClassifier())
+        ocr.train(open_image('digits1'))
+        images = ['digits2', 'digits1', open_image('digits2')]
+        expected = [ocr.ocr(image)[0] for image in images]
+        ordered = [chars for chars, _, _ in ocr.ocr_batch(images, workers=2)]
+        self.assertEqual(ordered, expected)
+        unordered = dict((i, chars) for i, (chars, _, _) in ocr.ocr_batch(images, workers=2, ordered=False))
+        self.assertEqual([unordered[i] for i in range(len(images))], expected)
+
+    def test_train_many(self):
+        data_dir = simpleocr.files.DATA_DIRECTORY
+        progress = []
+        ocr = OCR(ContourSegmenter(blur_y=5, blur_x=5), SimpleFeatureExtractor(), KNNClassifier())
+        paths = ocr.train_many(data_dir, workers=2, progress=lambda done, total: progress.append((done, total)))
+        self.assertEqual(progress, [(i, len(paths)) for i in range(1, len(paths) + 1)])
+        expected = OCR(ContourSegmenter(blur_y=5, blur_x=5), SimpleFeatureExtractor(), KNNClassifier())
+        for path in paths:
+            expected.train(path)
+        for a, b in zip(ocr.classifier.get_samples(), expected.classifier.get_samples()):
+            self.assertTrue(numpy.array_equal(a, b))
+        self.assertIsNone(ocr._training_copy().classifier.get_samples()[0])  # what workers are sent
+        single = OCR(ContourSegmenter(blur_y=5, blur_x=5), SimpleFeatureExtractor(), KNNClassifier())
+        single.train_many(os.path.join(data_dir, "digits*.png"), workers=1)
+        self.assertEqual(len(single.classifier.get_samples()[0]), sum(
+            len(open_image(os.path.join(data_dir, name)).ground.segments) for name in ["digits1", "digits2"]))
+
+    def test_save_load(self):
+        ocr = OCR(ContourSegmenter(blur_y=5, blur_x=5), SimpleFeatureExtractor(feature_size=12), KNNClassifier())
+        ocr.train(open_image('digits1'))
+        path = tempfile.mkdtemp()
+        try:
+            ocr.save(path)
+            loaded = OCR.load(path)
+        finally:
+            shutil.rmtree(path)
+        self.assertEqual(loaded.segmenter.get_parameters(), ocr.segmenter.get_parameters())
+        self.assertEqual(loaded.extractor.feature_size, 12)
+        test_file = open_image('digits2')
+        self.assertEqual(loaded.ocr(test_file)[0], ocr.ocr(test_file)[0])
+        blank = Image(test_file.image)  # no classified glyphs, so nothing is added to the (read-only) samples
+        blank.set_ground(test_file.ground.segments, classes_to_numpy(BLANK_CLASS * len(test_file.ground.segments)))
+        loaded.train(blank)
+        self.assertEqual(loaded.ocr(test_file)[0], ocr.ocr(test_file)[0])
+
+    def test_stats(self):
+        ocr = OCR(ContourSegmenter(blur_y=5, blur_x=5), SimpleFeatureExtractor(), KNNClassifier())
+        ocr.train(open_image('digits1'))
+        self.assertIsNone(ocr.get_stats())
+        ocr.enable_stats()
+        _, _, segments = ocr.ocr(open_image('digits2'))
+        stats = ocr.get_stats()
+        segmenter_stats = stats["segmenter"]
+        self.assertEqual(segmenter_stats["calls"], 1)
+        self.assertEqual(segmenter_stats["output_size"], len(segments))
+        self.assertEqual(len(segmenter_stats["processors"]), len(ocr.segmenter.processors))
+        for processor_stats in segmenter_stats["processors"]:
+            self.assertEqual(processor_stats["calls"], 1)
+        self.assertEqual(stats["extractor"]["output_size"], len(segments))
+        self.assertEqual(stats["classifier"]["calls"], 1)
+        ocr.reset_stats()
+        self.assertEqual(ocr.get_stats()["segmenter"]["calls"], 0)
+
+    def test_lean(self):
+        test_file = open_image('digits2')
+        large = test_file.image.nbytes // 10  # any image (or blurred, binarized copy of one)
+        for segmenter in (ContourSegmenter, TiledContourSegmenter, PyramidContourSegmenter):
+            ocr = OCR(segmenter(blur_y=5, blur_x=5), SimpleFeatureExtractor(), KNNClassifier())
+            lean_ocr = OCR(segmenter(blur_y=5, blur_x=5), SimpleFeatureExtractor(), KNNClassifier(), lean=True)
+            for o in (ocr, lean_ocr):
+                o.train(open_image('digits1'))
+            self.assertEqual(lean_ocr.ocr(test_file)[0], ocr.ocr(test_file)[0])
+            for processor in [lean_ocr.segmenter] + lean_ocr.segmenter.processors:
+                for name in processor.DEBUG_ATTRIBUTES:
+                    self.assertFalse(hasattr(processor, name))
+                for name, value in vars(processor).items():  # including undeclared ones
+                    self.assertFalse(isinstance(value, numpy.ndarray) and value.nbytes > large,
+                                     "{0}.{1} kept".format(processor.__class__.__name__, name))
+
+    def test_projection(self):
+        ocr = OCR(ContourSegmenter(blur_y=5, blur_x=5), SimpleFeatureExtractor(), KNNClassifier(),
+                  projection=PCAProjection(n_components=12))
+        ocr.train(open_image('digits1'))
+        self.assertEqual(ocr.classifier.get_samples()[0].shape[1], 12)
+        test_file = open_image('digits2')
+        expected = reconstruct_chars(test_file.ground.classes)
+        self.assertEqual(ocr.ocr(test_file)[0], expected)
+        path = tempfile.mkdtemp()
+        try:
+            ocr.save(path)
+            loaded = OCR.load(path)
+        finally:
+            shutil.rmtree(path)
+        self.assertEqual(loaded.projection.n_components, 12)
+        self.assertEqual(loaded.ocr(test_file)[0], expected)
+
+    def test_projection_refit(self):
+        def projected_ocr():
+            return OCR(ContourSegmenter(blur_y=5, blur_x=5), SimpleFeatureExtractor(), KNNClassifier(),
+                       projection=PCAProjection(n_components=12))
+        paths = [os.path.join(simpleocr.files.DATA_DIRECTORY, name + ".png") for name in ("digits1", "digits2")]
+        successive, at_once = projected_ocr(), projected_ocr()
+        for path in paths:
+            successive.train(path)
+        at_once.train_many(paths, workers=1)
+        test_file = open_image('digits2')
+        self.assertEqual(successive.ocr(test_file)[0], at_once.ocr(test_file)[0])
+        # fitted again on the samples of both files (before classifying), and the samples projected again
+        self.assertTrue(numpy.allclose(successive.projection.mean, at_once.projection.mean))
+        for a, b in zip(successive.classifier.get_samples(), at_once.classifier.get_samples()):
+            self.assertTrue(numpy.allclose(a, b, atol=1e-3))
+        copied = pickle.loads(pickle.dumps(at_once))  # as sent to worker processes
+        self.assertIsNone(copied._projection_samples)
+        self.assertEqual(copied.ocr(test_file)[0], at_once.ocr(test_file)[0])
+        mean, samples = successive.projection.mean.copy(), len(successive.classifier.get_samples()[0])
+        successive.fit_projection()
+        self.assertIsNone(successive._projection_samples)
+        successive.train(paths[0])  # fixed: only projected
+        self.assertTrue(numpy.array_equal(successive.projection.mean, mean))
+        self.assertGreater(len(successive.classifier.get_samples()[0]), samples)
+
+    def test_cascade(self):
+        test_file = open_image('digits2')
+        full = OCR(ContourSegmenter(blur_y=5, blur_x=5), SimpleFeatureExtractor(), KNNClassifier())
+        full.train(open_image('digits1'))
+        expected = full.ocr(test_file)[0]
+        for max_distance, fully_classified in ((0.0, True), (1000.0, False)):
+            ocr = OCR(ContourSegmenter(blur_y=5, blur_x=5), SimpleFeatureExtractor(), KNNClassifier(),
+                      cascade=CascadeStage(max_distance=max_distance))
+            ocr.train(open_image('digits1'))
+            ocr.enable_stats()
+            self.assertEqual(ocr.ocr(test_file)[0], expected)
+            self.assertEqual(ocr.get_stats()["classifier"]["calls"] > 0, fully_classified)
+        path = tempfile.mkdtemp()
+        try:
+            ocr.save(path)
+            loaded = OCR.load(path)
+        finally:
+            shutil.rmtree(path)
+        self.assertEqual(loaded.cascade.max_distance, 1000.0)
+        self.assertEqual(loaded.cascade.extractor.feature_size, 5)
+        self.assertEqual(loaded.ocr(test_file)[0], expected)
+        thread_copy = loaded._thread_copy()
+        self.assertIs(thread_copy.classifier, loaded.classifier)
+        self.assertIs(thread_copy.cascade.classifier, loaded.cascade.classifier)
+        self.assertIsNot(thread_copy.cascade.extractor, loaded.cascade.extractor)
+        self.assertEqual(thread_copy.cascade.max_distance, 1000.0)
+        self.assertEqual(thread_copy.ocr(test_file)[0], expected)
+        extracting_copy = loaded._thread_copy(share_classifier=False)
+        self.assertIsNone(extracting_copy.cascade)
+        self.assertIsNot(extracting_copy.classifier, loaded.classifier)
+        self.assertIsNot(extracting_copy.segmenter, loaded.segmenter)
+        self.assertTrue(numpy.array_equal(extracting_copy.extract(test_file)[1], loaded.extract(test_file)[1]))
+
+    def test_rois(self):
+        ocr = OCR(ContourSegmenter(blur_y=5, blur_x=5), SimpleFeatureExtractor(), KNNClassifier())
+        ocr.train(open_image('digits1'))
+        test_file = open_image('digits2')
+        chars, _, segments = ocr.ocr(test_file)
+        height, width = test_file.image.shape[:2]
+        rois = [(0, 0, width, 250), (0, 250, width, height - 250)]  # split between two lines of text
+        for workers in (1, 2):
+            results = ocr.ocr(test_file, rois=rois, roi_workers=workers)
+            self.assertEqual(len(results), 2)
+            self.assertEqual("".join(c for c, _, _ in results), chars)
+            self.assertEqual(numpy.concatenate([s for _, _, s in results]).tolist(), segments.tolist())
@@ -1,6 +1,10 @@
 import unittest
+import numpy
 from simpleocr import opencv_utils
 from simpleocr.files import open_image
+from simpleocr.segmentation import ContourSegmenter
+from simpleocr.improver import enhance_image, crop_image
+from tests.pil_reference import pil_enhance
 
 
 class TestOpenCVUtils(unittest.TestCase):
@@ -16,8 +20,72 @@ class TestOpenCVUtils(unittest.TestCase):
         # TODO: Add checking and try display() function
         # TODO: Verify the result
 
+    def test_opencv_brightness_lut(self):
+        levels = numpy.arange(256, dtype=numpy.uint8).reshape(16, 16)
+        for brightness in (-1.0, -0.3, 0.0, 0.5, 1.0):
+            result = opencv_utils.BrightnessProcessor(brightness=brightness).process(levels)
+            expected = numpy.clip(levels.astype(int) + int(brightness * 256), 0, 255)
+            self.assertTrue(numpy.array_equal(result, expected))
+        self.assertTrue(numpy.array_equal(levels.ravel(), numpy.arange(256)))  # not modified
+
+    def test_lookup_tables_bounded(self):
+        for i in range(2 * opencv_utils.MAX_LOOKUP_TABLES):
+            opencv_utils.ContrastProcessor(scale=1.0 + i / 100.0).process(numpy.zeros((2, 2), dtype=numpy.uint8))
+        self.assertEqual(len(opencv_utils._lookup_tables), opencv_utils.MAX_LOOKUP_TABLES)
+        self.assertIs(opencv_utils.brightness_table(0.6), opencv_utils.brightness_table(0.6))
+
+    def test_opencv_contrast(self):
+        levels = numpy.arange(256, dtype=numpy.uint8).reshape(16, 16)
+        processor = opencv_utils.ContrastProcessor(scale=1.0)
+        self.assertTrue(numpy.array_equal(processor.process(levels), levels))
+        lower = opencv_utils.ContrastProcessor(scale=0.5).process(levels).ravel()
+        self.assertEqual((lower.min(), lower.max()), (64, 191))
+        higher = opencv_utils.ContrastProcessor(scale=2.0).process(levels).ravel()
+        self.assertEqual((higher[:64].max(), higher[192:].min(), higher[128]), (0, 255, 128))
+        self.assertTrue(numpy.all(numpy.diff(higher.astype(int)) >= 0))
+
     # TODO: Check other ImageProcessors
 
     def test_opencv_imageprocesser(self):
         processor = opencv_utils.ImageProcessor()
         self.assertRaises(NotImplementedError, lambda: processor._image_processing(object))
+
+    def test_image_context(self):
+        image = open_image('digits1').image
+        context = opencv_utils.ImageContext(image)
+        self.assertIs(context.gray, context.gray)
+        self.assertIs(context.blurred(0, 0), context)
+        self.assertIs(context.blurred(3, 3), context.blurred(3, 3))
+        self.assertTrue(numpy.array_equal(context.blurred(3, 3).image, opencv_utils.blur_image(image, 3, 3)))
+        self.assertIs(context.binarized(11, 10), context.binarized(11, 10))
+        # processors that don't accept contexts are given the image
+        processor = opencv_utils.BrightnessProcessor(brightness=0.5)
+        self.assertTrue(numpy.array_equal(processor.process(context), processor.process(image)))
+        # the segmentation is the same, with or without the context
+        segmenter = ContourSegmenter()
+        self.assertTrue(numpy.array_equal(segmenter.process(context), segmenter.process(image)))
+
+    def test_enhance(self):
+        image = open_image('digits1')
+        original = image.image.copy()
+        exact = [{"brightness": 1.2}, {"contrast": 1.5, "invert": True}, {"sharpness": 2.0}]
+        for settings in exact:
+            result = opencv_utils.EnhanceProcessor(**settings).process(image.image)
+            self.assertTrue(numpy.array_equal(result, pil_enhance(image, **settings)))
+        settings = {"color": 0.5, "brightness": 1.2, "contrast": 1.5, "sharpness": 2.0, "invert": True}
+        result = opencv_utils.EnhanceProcessor(**settings).process(image.image)
+        self.assertLessEqual(numpy.abs(result.astype(int) - pil_enhance(image, **settings)).max(), 3)
+        self.assertTrue(numpy.array_equal(image.image, original))  # the input isn't modified
+        enhanced = enhance_image(image, brightness=1.2)
+        self.assertTrue(numpy.array_equal(enhanced.image, pil_enhance(image, brightness=1.2)))
+        self.assertTrue(numpy.array_equal(image.image, original))
+
+    def test_crop_image(self):
+        image = open_image('digits1')
+        shape = image.image.shape
+        cropped = crop_image(image, (10, 20, 50, 80))
+        self.assertTrue(numpy.array_equal(cropped.image, image.image[20:80, 10:50]))
+        self.assertFalse(cropped.is_grounded)  # the ground is in the page's coordinates
+        image.release_image()  # neither image changes when the page is read again
+        self.assertEqual(cropped.image.shape[:2], (60, 40))
+        self.assertEqual(image.image.shape, shape)
@@ -0,0 +1,43 @@
+import unittest
+import cv2
+from simpleocr.files import open_image
+from simpleocr.segmentation import ContourSegmenter, TiledContourSegmenter, PyramidContourSegmenter
+
+
+def _sorted_rows(segments):
+    return sorted(map(tuple, segments.tolist()))
+
+
+class TestTiledContourSegmenter(unittest.TestCase):
+    def test_same_as_untiled(self):
+        for name in ('digits1', 'digits2', 'unicode1'):
+            image = open_image(name).image
+            expected = ContourSegmenter(blur_x=5, blur_y=5).process(image)
+            for workers in (1, 3):
+                segmenter = TiledContourSegmenter(blur_x=5, blur_y=5, tile_size=64, tile_overlap=60,
+                                                  tile_workers=workers)
+                self.assertEqual(_sorted_rows(segmenter.process(image)), _sorted_rows(expected))
+
+    def test_overlap_too_small(self):
+        segmenter = TiledContourSegmenter(blur_x=5, blur_y=5, tile_overlap=4)
+        with self.assertRaises(ValueError):
+            segmenter.process(open_image('digits1').image)
+
+
+class TestPyramidContourSegmenter(unittest.TestCase):
+    def test_same_as_original_scale(self):
+        for name in ('digits1', 'digits2'):
+            image = open_image(name).image
+            expected = ContourSegmenter(blur_x=5, blur_y=5).process(image)
+            big = cv2.resize(image, None, fx=4, fy=4, interpolation=cv2.INTER_NEAREST)
+            for parameters in ({"glyph_height": 80}, {"max_working_size": max(image.shape)}):
+                segmenter = PyramidContourSegmenter(blur_x=5, blur_y=5, **parameters)
+                segments = segmenter.process(big)
+                self.assertEqual(segmenter.processors[0].scale, 4)
+                self.assertEqual(segments.tolist(), (expected * 4).tolist())
+
+    def test_no_scaling(self):
+        image = open_image('digits1').image
+        expected = ContourSegmenter(blur_x=5, blur_y=5).process(image)
+        segments = PyramidContourSegmenter(blur_x=5, blur_y=5).process(image)
+        self.assertEqual(segments.tolist(), expected.tolist())
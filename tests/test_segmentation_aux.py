@@ -0,0 +1,42 @@
+import unittest
+import numpy
+from simpleocr.files import open_image
+from simpleocr.segmentation import ContourSegmenter, RawContourSegmenter, SEGMENT_DATATYPE
+from simpleocr.segmentation_aux import contained_segments, contained_segments_matrix, LineFinder
+from simpleocr.segmentation_filters import LargeFilter, SmallFilter
+
+
+class TestContainedSegments(unittest.TestCase):
+    def _assert_same_as_matrix(self, segments):
+        expected = numpy.max(contained_segments_matrix(segments), axis=1)
+        self.assertTrue(numpy.array_equal(contained_segments(segments), expected))
+
+    def test_bundled_data(self):
+        for name in ('digits1', 'digits2', 'unicode1'):
+            segments = RawContourSegmenter().process(open_image(name).image)
+            self._assert_same_as_matrix(segments)
+            segments = SmallFilter().process(LargeFilter().process(segments))
+            self._assert_same_as_matrix(segments)
+
+    def test_ties(self):
+        rng = numpy.random.RandomState(0)
+        for n in (1, 2, 3, 17, 64, 100):
+            segments = rng.randint(0, 8, size=(n, 4)).astype(SEGMENT_DATATYPE)
+            self._assert_same_as_matrix(segments)
+
+
+class TestLineFinder(unittest.TestCase):
+    def test_projection_matches_kmeans(self):
+        for name in ('digits1', 'digits2', 'unicode1'):
+            segments = ContourSegmenter(blur_x=5, blur_y=5).process(open_image(name).image)
+            kmeans, projection = LineFinder(line_method="kmeans"), LineFinder(line_method="projection")
+            kmeans.process(segments)
+            projection.process(segments)
+            self.assertEqual(projection.lines_topmiddlebottoms.shape, kmeans.lines_topmiddlebottoms.shape)
+            difference = numpy.abs(projection.lines_topmiddlebottoms - kmeans.lines_topmiddlebottoms)
+            self.assertLess(numpy.max(difference), 1.0)
+
+    def test_unknown_method(self):
+        segments = open_image('digits1').ground.segments
+        with self.assertRaises(ValueError):
+            LineFinder(line_method="nonexistent").process(segments)
@@ -0,0 +1,82 @@
+import json
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from http.client import HTTPConnection
+from urllib.request import urlopen
+import cv2
+from simpleocr.segmentation import ContourSegmenter
+from simpleocr.feature_extraction import SimpleFeatureExtractor
+from simpleocr.files import open_image
+from simpleocr.classification import KNNClassifier
+from simpleocr.ocr import OCR
+from simpleocr.serve import OCRServer, create_http_server
+
+
+class TestServe(unittest.TestCase):
+    def setUp(self):
+        self.ocr = OCR(ContourSegmenter(blur_y=5, blur_x=5), SimpleFeatureExtractor(), KNNClassifier())
+        self.ocr.train(open_image('digits1'))
+
+    def test_batching(self):
+        server = OCRServer(self.ocr, batch_size=4, max_wait=0.05, workers=4)
+        try:
+            images = [open_image(name) for name in ['digits1', 'digits2'] * 4]
+            with ThreadPoolExecutor(8) as pool:
+                results = list(pool.map(server.ocr, images))
+            metrics = server.get_metrics()
+        finally:
+            server.close()
+        self.assertEqual([r[0][0] for r in results], [self.ocr.ocr(image)[0] for image in images])
+        self.assertEqual(metrics["requests"], len(images))
+        self.assertGreater(metrics["batch_size"]["max"], 1)
+
+    def test_close(self):
+        server = OCRServer(self.ocr, batch_size=4, max_wait=5, workers=1)
+        image = open_image('digits2')
+        results = []
+        thread = threading.Thread(target=lambda: results.append(server.ocr(image)))
+        thread.start()
+        time.sleep(0.3)  # the request waits for its batch to fill
+        server.close()
+        thread.join(2)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(results[0][0][0], self.ocr.ocr(image)[0])
+        self.assertRaises(RuntimeError, server.ocr, image)
+        server.close()
+
+    def test_http(self):
+        server = OCRServer(self.ocr, workers=2)
+        http_server = create_http_server(server, port=0)
+        thread = threading.Thread(target=http_server.serve_forever)
+        thread.start()
+        try:
+            url = "http://127.0.0.1:{0}".format(http_server.server_address[1])
+            image = open_image('digits2')
+            body = cv2.imencode(".png", image.image)[1].tobytes()
+            result = json.loads(urlopen(url + "/ocr", data=body).read().decode("utf-8"))
+            metrics = json.loads(urlopen(url + "/metrics").read().decode("utf-8"))
+            bad_requests = [(b"", {"Content-Length": "0"}), (b"", {}), (b"x", {"Content-Length": "one"}),
+                            (b"not a image", {"Content-Length": "11"})]
+            for body, headers in bad_requests:
+                connection = HTTPConnection("127.0.0.1", http_server.server_address[1])
+                try:
+                    connection.putrequest("POST", "/ocr")
+                    for header in headers.items():
+                        connection.putheader(*header)
+                    connection.endheaders(body)
+                    response = connection.getresponse()
+                    self.assertEqual(response.status, 400)
+                    self.assertIn("error", json.loads(response.read().decode("utf-8")))
+                finally:
+                    connection.close()
+        finally:
+            http_server.shutdown()
+            http_server.server_close()
+            thread.join()
+            server.close()
+        chars, classes, segments = self.ocr.ocr(image)
+        self.assertEqual(result["chars"], chars)
+        self.assertEqual(result["segments"], segments.tolist())
+        self.assertEqual(metrics["requests"], 1)
@@ -0,0 +1,75 @@
+import os
+import shutil
+import tempfile
+import unittest
+import cv2
+import numpy
+from simpleocr.segmentation import ContourSegmenter
+from simpleocr.feature_extraction import SimpleFeatureExtractor
+from simpleocr.files import open_image, Image
+from simpleocr.classification import KNNClassifier
+from simpleocr.ocr import OCR
+from simpleocr.video import FrameOCR, read_frames, changed_tiles
+
+
+class TestFrameOCR(unittest.TestCase):
+    def setUp(self):
+        segmenter = ContourSegmenter(blur_y=5, blur_x=5, line_method="projection")
+        self.ocr = OCR(segmenter, SimpleFeatureExtractor(), KNNClassifier())
+        self.ocr.train(open_image('digits1'))
+        self.image = open_image('digits2').image
+
+    def _frames(self, n):
+        """frames where, one at a time, glyphs are replaced by others of about the same width"""
+        segments = self.ocr.ocr(Image(self.image))[2].astype(int)
+        random = numpy.random.RandomState(0)
+        frame = self.image
+        for _ in range(n):
+            frame = frame.copy()
+            x, y, w, h = segments[random.randint(len(segments))]
+            xs, ys, _, hs = segments[random.choice(numpy.flatnonzero(abs(segments[:, 2] - w) <= 2))]
+            frame[y - 2:y + h + 2, x - 1:x + w + 1] = 255
+            frame[y:y + hs, x:x + w] = self.image[ys:ys + hs, xs:xs + w]
+            yield frame
+
+    def test_changed_tiles(self):
+        frame = self.image.copy()
+        frame[40, 70] = 0
+        frame[-1, -1] = 0
+        changed = changed_tiles(cv2.absdiff(self.image, frame), 32, 32)
+        self.assertEqual(changed.shape, (15, 19))
+        self.assertEqual(numpy.flatnonzero(changed).tolist(), [1 * 19 + 2, 15 * 19 - 1])
+
+    def test_frames(self):
+        frame_ocr = FrameOCR(self.ocr)
+        chars, _, _ = frame_ocr.ocr(self.image)
+        self.assertIsNone(frame_ocr.regions)  # the first frame is processed whole
+        self.assertEqual(frame_ocr.ocr(self.image.copy())[0], chars)
+        self.assertEqual(frame_ocr.regions, [])
+        frames = list(self._frames(10))
+        for frame, (chars, _, segments) in zip(frames, frame_ocr.ocr_stream(frames)):
+            self.assertIsNotNone(frame_ocr.regions)  # only the changed regions were processed
+            expected_chars, _, expected_segments = self.ocr.ocr(Image(frame))
+            self.assertEqual(chars, expected_chars)
+            self.assertEqual(segments.tolist(), expected_segments.tolist())
+        frame_ocr.reset()
+        frame_ocr.ocr(frames[0])
+        self.assertIsNone(frame_ocr.regions)
+
+    def test_read_frames(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, "frames.avi")
+            height, width = self.image.shape[:2]
+            writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), 10, (width, height))
+            if not writer.isOpened():
+                self.skipTest("opencv can't write videos")
+            for _ in range(3):
+                writer.write(self.image)
+            writer.release()
+            frames = list(read_frames(path))
+            self.assertEqual(len(frames), 3)
+            self.assertEqual(frames[0].shape, self.image.shape)
+            self.assertRaises(IOError, lambda: list(read_frames(os.path.join(directory, "missing.avi"))))
+        finally:
+            shutil.rmtree(directory)